@@ -0,0 +1,210 @@
+import asyncio
+import random
+from collections import Counter
+from types import SimpleNamespace
+from pyrogram import enums, raw
+from pyrogram.errors import FloodWait
+
+# Offline stand-in for the subset of pyrogram's Client/Message API used by
+# Forwarder and Uniquifier
+
+MEDIA_TYPES = ["photo", "video", "audio", "document", "animation"]
+
+class FakeMessage:
+    def __init__(self, client, chat_id, msg_id, empty=False, text=None, media=None, file_unique_id=None, media_group_id=None):
+        self._client = client
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = msg_id
+        self.empty = empty
+        self.text = text
+        self.media_group_id = media_group_id
+        for kind in MEDIA_TYPES + ["voice", "video_note", "sticker"]:
+            setattr(self, kind, None)
+        if media:
+            setattr(self, media, SimpleNamespace(file_unique_id=file_unique_id, file_id=file_unique_id))
+
+    async def copy(self, chat_id, **kwargs):
+        return await self._client.copy_message(chat_id, self.chat.id, self.id)
+
+    async def delete(self, revoke=True):
+        return await self._client.delete_messages(self.chat.id, self.id)
+
+    async def edit(self, text, reply_markup=None, **kwargs):
+        await self._client.call("edit_message_text")
+        return self
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        return await self.edit(text, reply_markup)
+
+    async def edit_reply_markup(self, reply_markup=None):
+        return await self.edit("", reply_markup)
+
+    async def reply(self, text, reply_markup=None, **kwargs):
+        return await self._client.send_message(self.chat.id, text, reply_markup=reply_markup)
+
+class FakeChat:
+    def __init__(self, chat_id, size, deleted_ratio=0.0, duplicate_ratio=0.0, album_ratio=0.0,
+                 gaps=(), username=None, seed=0):
+        # gaps: (start, end) ID ranges that were deleted in bulk
+        rng = random.Random(seed)
+        self.id = chat_id
+        self.username = username
+        self.latest_id = size
+        self.messages = {}
+        self.forwarded = set()
+        seen = []
+        msg_id = 1
+        while msg_id <= size:
+            if any(start <= msg_id <= end for start, end in gaps) or rng.random() < deleted_ratio:
+                msg_id += 1
+                continue
+            if rng.random() < album_ratio:
+                group = f"g{msg_id}"
+                for i in range(msg_id, min(msg_id + rng.randint(2, 5), size + 1)):
+                    uid = f"u{chat_id}_{i}"
+                    seen.append(uid)
+                    self.messages[i] = dict(media="photo", file_unique_id=uid, media_group_id=group)
+                    msg_id = i + 1
+                continue
+            kind = rng.choice(MEDIA_TYPES + ["text"])
+            if kind == "text":
+                self.messages[msg_id] = dict(text=f"message {msg_id}")
+            else:
+                if seen and rng.random() < duplicate_ratio:
+                    uid = rng.choice(seen)
+                else:
+                    uid = f"u{chat_id}_{msg_id}"
+                    seen.append(uid)
+                self.messages[msg_id] = dict(media=kind, file_unique_id=uid)
+            msg_id += 1
+
+class FakeClient:
+    def __init__(self, chats, latency=0.0, jitter=0.0, flood_every=0, flood_seconds=1, seed=0):
+        self.chats = {chat.id: chat for chat in chats}
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.calls = Counter()
+        self.floods = 0
+        self.rng = random.Random(seed)
+        self.next_id = {}
+        self.copied = []
+        self.deleted = []
+
+    async def call(self, method):
+        self.calls[method] += 1
+        total = sum(self.calls.values())
+        if self.flood_every and total % self.flood_every == 0:
+            self.floods += 1
+            raise FloodWait(value=self.flood_seconds)
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def chat(self, chat_id):
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        for chat in self.chats.values():
+            if chat.id == chat_id or (chat.username and chat.username == chat_id):
+                return chat
+        raise ValueError(f"Unknown chat {chat_id}")
+
+    def build(self, chat, msg_id):
+        data = chat.messages.get(msg_id)
+        if data is None:
+            return FakeMessage(self, chat.id, msg_id, empty=True)
+        return FakeMessage(self, chat.id, msg_id, **data)
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.call("get_messages")
+        chat = self.chat(chat_id)
+        if isinstance(message_ids, int):
+            return self.build(chat, message_ids)
+        message_ids = list(message_ids)
+        if len(message_ids) > 200:
+            raise ValueError("get_messages accepts at most 200 IDs")
+        return [self.build(chat, i) for i in message_ids]
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self.call("copy_message")
+        return self.store(chat_id, from_chat_id, [message_id])[0]
+
+    def rnd_id(self):
+        return self.rng.getrandbits(63)
+
+    async def resolve_peer(self, chat_id):
+        return SimpleNamespace(chat_id=self.chat(chat_id).id)
+
+    async def invoke(self, query):
+        # Only the raw call Forwarder makes: messages.ForwardMessages
+        if not isinstance(query, raw.functions.messages.ForwardMessages):
+            raise NotImplementedError(type(query).__name__)
+        await self.call("forward_messages")
+        if len(query.id) > 100:
+            raise ValueError("forward_messages accepts at most 100 IDs")
+        sent = self.store(query.to_peer.chat_id, query.from_peer.chat_id, query.id, forwarded=not query.drop_author)
+        updates = [raw.types.UpdateNewChannelMessage(message=msg, pts=0, pts_count=0) for msg in sent]
+        return raw.types.Updates(updates=updates, users=[], chats=[], date=0, seq=0)
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self.call("copy_media_group")
+        source = self.chat(from_chat_id)
+        group = source.messages[message_id]["media_group_id"]
+        ids = sorted(i for i, m in source.messages.items() if m.get("media_group_id") == group)
+        return self.store(chat_id, from_chat_id, ids)
+
+    def store(self, chat_id, from_chat_id, message_ids, forwarded=False):
+        # forwarded marks copies that would show a "Forwarded from" header
+        source = self.chat(from_chat_id)
+        target = self.chat(chat_id)
+        sent = []
+        for msg_id in message_ids:
+            target.latest_id += 1
+            target.messages[target.latest_id] = dict(source.messages.get(msg_id, {}))
+            if forwarded:
+                target.forwarded.add(target.latest_id)
+            self.copied.append(msg_id)
+            sent.append(self.build(target, target.latest_id))
+        return sent
+
+    async def delete_messages(self, chat_id, message_ids, revoke=True):
+        await self.call("delete_messages")
+        message_ids = [message_ids] if isinstance(message_ids, int) else list(message_ids)
+        if len(message_ids) > 100:
+            raise ValueError("delete_messages accepts at most 100 IDs")
+        try:
+            chat = self.chat(chat_id)
+        except ValueError:
+            # Status messages live in the admin's private chat
+            return len(message_ids)
+        for msg_id in message_ids:
+            if chat.messages.pop(msg_id, None) is not None:
+                self.deleted.append(msg_id)
+        return len(message_ids)
+
+    async def get_chat(self, chat_id):
+        await self.call("get_chat")
+        chat = self.chat(chat_id)
+        return SimpleNamespace(id=chat.id, type=enums.ChatType.CHANNEL, username=chat.username, invite_link=None)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self.call("get_chat_member")
+        self.chat(chat_id)
+        return SimpleNamespace(
+            status=enums.ChatMemberStatus.ADMINISTRATOR,
+            privileges=SimpleNamespace(can_delete_messages=True, can_post_messages=True)
+        )
+
+    async def send_chat_action(self, chat_id, action):
+        await self.call("send_chat_action")
+        return True
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await self.call("send_message")
+        msg_id = self.next_id.get(chat_id, 0) + 1
+        self.next_id[chat_id] = msg_id
+        return FakeMessage(self, chat_id, msg_id, text=text)
+
+    def api_calls(self, exclude=("edit_message_text", "send_message")):
+        return sum(n for method, n in self.calls.items() if method not in exclude)
@@ -0,0 +1,132 @@
+"""Offline throughput benchmarks for Forwarder and Uniquifier.
+
+Run from the repository root:
+
+    python -m bench.run                     # all scenarios
+    python -m bench.run forward_sparse      # a single scenario
+    python -m bench.run --latency 0.05 --real-limits
+    python -m bench.run --workers 3         # shard reads across worker sessions
+
+Each scenario reports IDs processed per second, Telegram API calls per ID
+(status edits excluded) and peak Python memory.
+"""
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+
+import ratelimit
+from ratelimit import scheduler
+from chatcache import chat_cache
+from dedup import dedup_index
+from sessions import session_pool
+from forward import Forwarder
+from uniquify import Uniquifier
+from bench.fake_client import FakeChat, FakeClient
+
+SOURCE = -1001
+TARGET = -1002
+ADMIN_CHAT = 1
+
+SCENARIOS = {
+    "forward_dense": dict(job="forward", size=5000, deleted_ratio=0.02),
+    "forward_sparse": dict(job="forward", size=20000, deleted_ratio=0.05, gaps=((2000, 18000),)),
+    "forward_photo_filter": dict(job="forward", size=20000, deleted_ratio=0.02, msg_filter="PHOTO"),
+    "forward_bulk_albums": dict(job="forward", size=20000, deleted_ratio=0.02, album_ratio=0.1, mode="BULK"),
+    "forward_flood": dict(job="forward", size=5000, deleted_ratio=0.02, flood_every=500),
+    "uniquify_duplicates": dict(job="uniquify", size=20000, deleted_ratio=0.02, duplicate_ratio=0.3),
+    "uniquify_sparse": dict(job="uniquify", size=20000, deleted_ratio=0.05, duplicate_ratio=0.1, gaps=((2000, 15000),)),
+}
+
+def reset_shared_state(real_limits):
+    # Scenarios share the module-level scheduler and caches, so start each clean
+    scheduler.method_buckets.clear()
+    scheduler.chat_buckets.clear()
+    chat_cache.entries.clear()
+    dedup_index.chats.clear()
+    dedup_index.pending.clear()
+    if not real_limits:
+        # Measure the job pipeline, not Telegram's published limits
+        ratelimit.METHOD_RATES = {}
+        ratelimit.DEFAULT_METHOD_RATE = 1e6
+        ratelimit.CHAT_RATE = ratelimit.CHAT_MAX_RATE = 1e6
+        ratelimit.SEND_CHAT_RATE = ratelimit.SEND_CHAT_MAX_RATE = 1e6
+
+async def run_scenario(name, spec, latency, jitter, real_limits, workers):
+    reset_shared_state(real_limits)
+    size = spec["size"]
+    source = FakeChat(
+        SOURCE, size,
+        deleted_ratio=spec.get("deleted_ratio", 0.0),
+        duplicate_ratio=spec.get("duplicate_ratio", 0.0),
+        album_ratio=spec.get("album_ratio", 0.0),
+        gaps=spec.get("gaps", ()),
+    )
+    target = FakeChat(TARGET, 0)
+    client = FakeClient([source, target], latency=latency, jitter=jitter, flood_every=spec.get("flood_every", 0))
+    session_pool.clients.clear()
+    worker_clients = [FakeClient([source, target], latency=latency, jitter=jitter) for _ in range(workers)]
+    for i, worker in enumerate(worker_clients):
+        session_pool.add(f"worker_{i}", worker)
+    status = await client.send_message(ADMIN_CHAT, "bench")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    if spec["job"] == "forward":
+        forwarder = Forwarder(client, status_interval=1)
+        await forwarder.start_forwarding(
+            str(SOURCE), str(TARGET), 1, size, spec.get("msg_filter", "ALL"), status, mode=spec.get("mode", "COPY")
+        )
+        done = len(client.copied)
+    else:
+        uniquifier = Uniquifier(client, status_interval=1)
+        await uniquifier.set_chat(ADMIN_CHAT, str(SOURCE), status)
+        await uniquifier.start_purge(ADMIN_CHAT, 1, size, status)
+        done = len(client.deleted)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "ids": size,
+        "done": done,
+        "seconds": elapsed,
+        "ids_per_sec": size / elapsed if elapsed else float("inf"),
+        "calls_per_id": (client.api_calls() + sum(w.api_calls() for w in worker_clients)) / size,
+        "edits": client.calls["edit_message_text"],
+        "floods": client.floods,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+def print_results(results):
+    header = f"{'scenario':<24}{'ids':>8}{'done':>8}{'sec':>9}{'ids/s':>11}{'calls/id':>10}{'edits':>7}{'floods':>8}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<24}{r['ids']:>8}{r['done']:>8}{r['seconds']:>9.2f}{r['ids_per_sec']:>11.0f}"
+            f"{r['calls_per_id']:>10.4f}{r['edits']:>7}{r['floods']:>8}{r['peak_mb']:>9.2f}"
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.01, help="Per-call latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument("--real-limits", action="store_true", help="Keep the scheduler's production rate limits")
+    parser.add_argument("--workers", type=int, default=0, help="Number of simulated worker sessions")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.ERROR)
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        results.append(await run_scenario(name, SCENARIOS[name], args.latency, args.jitter, args.real_limits, args.workers))
+    print_results(results)
+
+if __name__ == "__main__":
+    asyncio.run(main())
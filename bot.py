@@ -1,16 +1,22 @@
 import os
 import time
-import psutil
 import asyncio
 import logging
-import requests
 import random
 from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from database import db
 from forward import Forwarder, get_font
 from uniquify import Uniquifier
-from aiohttp import web
+from mirror import Mirror
+from fsub import ForceSub
+from ratelimit import scheduler
+from jobs import registry
+from jobqueue import job_queue, run_job, forward_spec, uniquify_spec
+from sessions import session_pool
+from metrics import metrics_handler
+from health import Watchdog, SystemStats
+from aiohttp import web, ClientSession, ClientTimeout
 from dotenv import load_dotenv
 
 # Setup logging
@@ -24,18 +30,37 @@ API_HASH = os.environ.get("API_HASH", "")
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 ADMINS = [int(x) for x in os.environ.get("ADMINS", "").split()]
 RENDER_URL = os.environ.get("RENDER_URL", "")
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", 4))
+AUTO_RESUME = os.environ.get("AUTO_RESUME", "true").lower() == "true"
+STATUS_INTERVAL = int(os.environ.get("STATUS_INTERVAL", 5))
+# Hand jobs to worker.py processes through MongoDB instead of running them here
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "false").lower() == "true"
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", 0.5))
+# Extra bot tokens used only to read source chats in parallel (space separated)
+WORKER_TOKENS = os.environ.get("WORKER_TOKENS", "").split()
+
+MIRROR_FILTERS = ["ALL", "TEXT", "PHOTO", "VIDEO", "AUDIO", "DOCUMENT"]
 
 app = Client("forwarder_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-forwarder = Forwarder(app)
-uniquifier = Uniquifier(app)
+forwarder = Forwarder(app, prefetch_depth=PREFETCH_DEPTH, status_interval=STATUS_INTERVAL)
+uniquifier = Uniquifier(app, status_interval=STATUS_INTERVAL)
+mirror = Mirror(app, forwarder)
+force_sub = ForceSub(app)
+for i, token in enumerate(WORKER_TOKENS):
+    session_pool.add(f"worker_{i}", Client(f"worker_{i}", api_id=API_ID, api_hash=API_HASH, bot_token=token, no_updates=True))
+watchdog = Watchdog(threshold=LOOP_LAG_THRESHOLD)
+system_stats = SystemStats()
 start_time = time.time()
 
 async def handle(request):
     return web.Response(text="Bot is running!")
 
+async def health(request):
+    return web.json_response({"loop": watchdog.snapshot(), "system": system_stats.snapshot()})
+
 async def start_web_server():
     server = web.Application()
-    server.add_routes([web.get('/', handle)])
+    server.add_routes([web.get('/', handle), web.get('/metrics', metrics_handler), web.get('/health', health)])
     runner = web.AppRunner(server)
     await runner.setup()
     port = int(os.environ.get("PORT", 8080))
@@ -54,11 +79,75 @@ async def auto_pinger():
         logger.info(f"Pinger sleeping for {sleep_time} seconds...")
         await asyncio.sleep(sleep_time)
         try:
-            requests.get(RENDER_URL)
-            logger.info(f"Pinged {RENDER_URL} successfully.")
+            async with ClientSession(timeout=ClientTimeout(total=30)) as session:
+                async with session.get(RENDER_URL) as response:
+                    logger.info(f"Pinged {RENDER_URL}: {response.status}")
         except Exception as e:
             logger.error(f"Ping failed: {e}")
 
+def queue_enabled():
+    return JOB_QUEUE and db.jobs is not None
+
+async def resume_jobs(job_id=None):
+    resumed = 0
+    for cp in await db.get_checkpoints():
+        if job_id and cp["job_id"] != job_id:
+            continue
+        if cp.get("owner"):
+            # A mirror back-fill: the mirror retries its own gaps, and running
+            # both would only get one of them refused as a duplicate job
+            await db.delete_checkpoint(cp["job_id"])
+            continue
+        try:
+            if cp["kind"] == "forward":
+                if registry.get(cp["job_id"]):
+                    continue
+                status_msg = await app.send_message(cp["status_chat"], f"⏳ {get_font('Resuming forwarding from ID')} {cp['cursor']}...")
+            elif cp["kind"] == "uniquify":
+                if cp["user_id"] in uniquifier.purge_status:
+                    continue
+                status_msg = await app.send_message(cp["status_chat"], f"⏳ {get_font('Resuming uniquify from ID')} {cp['cursor']}...")
+            else:
+                continue
+            asyncio.create_task(run_job(forwarder, uniquifier, cp, status_msg))
+            resumed += 1
+        except Exception as e:
+            logger.error(f"Resume error for {cp['job_id']}: {e}")
+    return resumed
+
+# Group -1 runs before every other handler; admins are never gated
+@app.on_message(filters.private & ~filters.user(ADMINS), group=-1)
+async def fsub_gate(client, message):
+    missing = await force_sub.missing(message.from_user.id)
+    if missing:
+        await message.reply(f"🔒 {get_font('Join our channels to use this bot')}", reply_markup=await fsub_keyboard(missing))
+        message.stop_propagation()
+
+@app.on_callback_query(filters.regex("^bot_") & ~filters.user(ADMINS), group=-1)
+async def fsub_callback_gate(client, query):
+    if await force_sub.missing(query.from_user.id):
+        await query.answer(get_font("Join our channels to use this bot"), show_alert=True)
+        query.stop_propagation()
+
+@app.on_callback_query(filters.regex("^fsub_CHECK$"))
+async def fsub_check(client, query):
+    force_sub.invalidate(query.from_user.id)
+    missing = await force_sub.missing(query.from_user.id)
+    if missing:
+        return await query.answer(get_font("Join all channels first"), show_alert=True)
+    await query.message.edit(f"✅ {get_font('Thanks for joining')}! {get_font('Send')} /start")
+    await query.answer()
+
+@app.on_chat_member_updated()
+async def member_update_handler(client, update):
+    force_sub.on_member_update(update)
+
+async def fsub_keyboard(missing):
+    urls = await force_sub.join_links(missing)
+    rows = [[InlineKeyboardButton(f"📢 {get_font('Join Channel')} {i}", url=url)] for i, url in enumerate(urls, 1)]
+    rows.append([InlineKeyboardButton(f"🔄 {get_font('Check Again')}", callback_data="fsub_CHECK")])
+    return InlineKeyboardMarkup(rows)
+
 @app.on_message(filters.command("start") & filters.private)
 async def start_cmd(client, message):
     await db.add_user(message.from_user.id, message.from_user.first_name)
@@ -88,10 +177,17 @@ async def help_cmd(client, message):
         f"📖 **{get_font('Help Menu')}**\n\n"
         f"📤 **{get_font('Forwarding')}**:\n"
         f"• `/forward from_id to_id start_id end_id`\n"
-        f"• {get_font('Works with public channels without admin status')}.\n\n"
+        f"• {get_font('Works with public channels without admin status')}.\n"
+        f"• {get_font('Bulk mode keeps albums together and forwards other messages in batches')}.\n"
+        f"• {get_font('Skip duplicates leaves out files the destination already has')}.\n"
+        f"• `/jobs` - {get_font('List running jobs')}\n"
+        f"• `/resume [job_id]` - {get_font('Resume interrupted jobs')}\n"
+        f"• `/mirror from_id to_id [filter] [bulk]` - {get_font('Copy new posts as they arrive')}\n"
+        f"• `/unmirror from_id [to_id]` - {get_font('Stop mirroring')}\n\n"
         f"🧹 **{get_font('Uniquify')}**:\n"
         f"• `/chat chat_id` - {get_font('Set target chat')}\n"
         f"• `/delay seconds` - {get_font('Set deletion delay')}\n"
+        f"• `/near bits` - {get_font('Also remove similar media, 0 for exact only')}\n"
         f"• `/uniquify start_id end_id` - {get_font('Remove duplicates')}\n\n"
         f"⚙️ **{get_font('Other')}**:\n"
         f"• `/fsub id1 id2` - {get_font('Set force sub channels')}\n"
@@ -120,19 +216,29 @@ async def about_cmd(client, message):
 async def fsub_cmd(client, message):
     if len(message.command) < 2:
         return await message.reply(f"{get_font('Usage')}: /fsub id1 id2 ...")
-    channels = message.command[1:]
-    await db.set_config("fsub_channels", channels)
+    await force_sub.set_channels(message.command[1:])
     await message.reply(f"✅ {get_font('Force sub channels updated')}!")
 
 @app.on_message(filters.command("users") & filters.user(ADMINS))
 async def users_cmd(client, message):
-    users = await db.get_all_users()
-    text = f"👥 **{get_font('Total Users')}**: {len(users)}\n\n"
+    text, keyboard = await users_page()
+    await message.reply(text, reply_markup=keyboard)
+
+async def users_page(after=None, before=None):
+    users, has_prev, has_next = await db.get_users_page(after=after, before=before)
+    total = await db.count_users()
+    text = f"👥 **{get_font('Total Users')}**: {total}\n\n"
     for user in users:
         uid = user["user_id"]
-        name = user["name"]
+        name = user.get("name") or uid
         text += f"• [{name}](tg://user?id={uid}) (`{uid}`)\n"
-    await message.reply(text)
+
+    buttons = []
+    if users and has_prev:
+        buttons.append(InlineKeyboardButton(f"⬅️ {get_font('Prev')}", callback_data=f"usr_PREV_{users[0]['user_id']}"))
+    if users and has_next:
+        buttons.append(InlineKeyboardButton(f"{get_font('Next')} ➡️", callback_data=f"usr_NEXT_{users[-1]['user_id']}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
 
 @app.on_message(filters.command("chat") & filters.user(ADMINS))
 async def chat_cmd(client, message):
@@ -146,6 +252,12 @@ async def delay_cmd(client, message):
         return await message.reply(f"{get_font('Usage')}: /delay seconds")
     await uniquifier.set_delay(message.from_user.id, message.command[1], message)
 
+@app.on_message(filters.command("near") & filters.user(ADMINS))
+async def near_cmd(client, message):
+    if len(message.command) < 2:
+        return await message.reply(f"{get_font('Usage')}: /near bits")
+    await uniquifier.set_near(message.from_user.id, message.command[1], message)
+
 @app.on_message(filters.command(["uniquify", "purge"]) & filters.user(ADMINS))
 async def uniquify_cmd(client, message):
     if len(message.command) < 3:
@@ -157,13 +269,25 @@ async def uniquify_cmd(client, message):
     except ValueError:
         return await message.reply(get_font("Start ID and End ID must be integers"))
         
+    if queue_enabled():
+        user_id = message.from_user.id
+        if user_id not in uniquifier.chat_configs:
+            return await message.reply(f"❌ {get_font('Configure the target chat first using')} `/chat chat_id`")
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(get_font("Cancel"), callback_data="uni_CANCEL")]])
+        status_msg = await message.reply(f"📥 {get_font('Queued, waiting for a worker')}...", reply_markup=keyboard)
+        spec = uniquify_spec(
+            user_id, uniquifier.chat_configs[user_id], uniquifier.delays.get(user_id, 0), start_id, end_id,
+            uniquifier.near.get(user_id, 0)
+        )
+        job_id = await job_queue.enqueue(spec, status_msg)
+        return await status_msg.edit(f"📥 {get_font('Queued job')} `{job_id}`, {get_font('waiting for a worker')}...", reply_markup=keyboard)
+
     await uniquifier.start_purge(message.from_user.id, start_id, end_id, message)
 
 @app.on_message(filters.command("stats") & filters.user(ADMINS))
 async def stats_cmd(client, message):
-    cpu = psutil.cpu_percent()
-    ram = psutil.virtual_memory().percent
-    disk = psutil.disk_usage('/').percent
+    # Sampled in the background; psutil calls would block the loop
+    cpu, ram, disk = system_stats.cpu, system_stats.ram, system_stats.disk
     uptime = time.strftime("%Hh %Mm %Ss", time.gmtime(time.time() - start_time))
     
     text = (
@@ -171,10 +295,94 @@ async def stats_cmd(client, message):
         f"🖥️ **{get_font('CPU')}**: {cpu}%\n"
         f"💾 **{get_font('RAM')}**: {ram}%\n"
         f"💿 **{get_font('Disk')}**: {disk}%\n"
-        f"⏰ **{get_font('Uptime')}**: {uptime}"
+        f"⏰ **{get_font('Uptime')}**: {uptime}\n"
+        f"🚦 **{get_font('FloodWaits')}**: {scheduler.flood_waits} ({scheduler.flood_seconds}s)\n"
+        f"🐢 **{get_font('Loop Lag')}**: {watchdog.lag * 1000:.0f}ms ({watchdog.stalls} {get_font('stalls')})"
     )
     await message.reply(text)
 
+@app.on_message(filters.command("jobs") & filters.user(ADMINS))
+async def jobs_cmd(client, message):
+    if queue_enabled():
+        return await message.reply(await queued_jobs_text())
+
+    jobs = registry.list()
+    if not jobs:
+        return await message.reply(f"💤 {get_font('No jobs running')}")
+
+    text = f"⚙️ **{get_font('Running Jobs')}**: {len(jobs)}\n\n"
+    for job in jobs:
+        stats = job.stats
+        text += (
+            f"• `{job.id}` {get_font(job.kind.capitalize())} "
+            f"`{stats['from_chat']}` → `{stats['to_chat']}`\n"
+            f"  {stats['processed']}/{stats['total']} | {job.throughput():.1f} {get_font('msg/s')}\n"
+        )
+    await message.reply(text)
+
+async def queued_jobs_text():
+    docs = await job_queue.active()
+    if not docs:
+        return f"💤 {get_font('No jobs queued or running')}"
+
+    text = f"⚙️ **{get_font('Queued Jobs')}**: {len(docs)}\n\n"
+    for doc in docs:
+        spec = doc["spec"]
+        target = f"`{spec['from_chat']}` → `{spec['to_chat']}`" if spec["kind"] == "forward" else f"`{spec['chat_id']}`"
+        progress = doc.get("progress")
+        done = f"{progress['processed']}/{progress['total']}" if progress else f"{spec['start_id']}-{spec['end_id']}"
+        owner = f" | {doc['owner']}" if doc["owner"] else ""
+        text += (
+            f"• `{doc['_id']}` {get_font(spec['kind'].capitalize())} {target}\n"
+            f"  {get_font(doc['state'].capitalize())} | {done}{owner}\n"
+        )
+    return text
+
+@app.on_message(filters.command("resume") & filters.user(ADMINS))
+async def resume_cmd(client, message):
+    job_id = message.command[1] if len(message.command) > 1 else None
+    if queue_enabled():
+        # Workers take over and retry jobs on their own; only failed ones wait
+        if job_id and await job_queue.retry(job_id):
+            return await message.reply(f"▶️ {get_font('Job')} `{job_id}` {get_font('queued again')}")
+        return await message.reply(f"ℹ️ {get_font('Workers take over interrupted jobs automatically, /resume job_id queues a failed one again')}")
+    resumed = await resume_jobs(job_id)
+    if not resumed:
+        return await message.reply(f"💤 {get_font('No saved jobs to resume')}")
+    await message.reply(f"▶️ {get_font('Resumed')} {resumed} {get_font('job(s)')}")
+
+@app.on_message(filters.command("mirror") & filters.user(ADMINS))
+async def mirror_cmd(client, message):
+    if len(message.command) < 3:
+        links = mirror.list()
+        if not links:
+            return await message.reply(f"{get_font('Usage')}: /mirror from_id to_id [ALL|TEXT|PHOTO|VIDEO|AUDIO|DOCUMENT] [bulk]")
+        text = f"🔁 **{get_font('Mirrors')}**: {len(links)}\n\n"
+        for link in links:
+            text += f"• `{link.from_chat}` → `{link.to_chat}` {link.filter} {link.mode} | {get_font('Last ID')}: {link.last_id}\n"
+        return await message.reply(text)
+
+    args = [arg.upper() for arg in message.command[3:]]
+    msg_filter = next((arg for arg in args if arg in MIRROR_FILTERS), "ALL")
+    mode = "BULK" if "BULK" in args else "COPY"
+    status_msg = await message.reply(f"⏳ {get_font('Setting up mirror')}...")
+    await mirror.add(message.command[1], message.command[2], msg_filter, mode, status_msg)
+
+@app.on_message(filters.command("unmirror") & filters.user(ADMINS))
+async def unmirror_cmd(client, message):
+    if len(message.command) < 2:
+        return await message.reply(f"{get_font('Usage')}: /unmirror from_id [to_id]")
+    to_chat = message.command[2] if len(message.command) > 2 else None
+    removed = await mirror.remove(message.command[1], to_chat)
+    if not removed:
+        return await message.reply(f"❌ {get_font('No such mirror')}")
+    await message.reply(f"✅ {get_font('Stopped')} {removed} {get_font('mirror(s)')}")
+
+# Lower priority group so new posts never shadow command handlers
+@app.on_message(filters.create(lambda _, __, message: message.chat is not None and mirror.is_source(message.chat.id)), group=1)
+async def mirror_handler(client, message):
+    await mirror.on_message(message)
+
 @app.on_message(filters.command("forward") & filters.user(ADMINS))
 async def forward_cmd(client, message):
     if len(message.command) < 5:
@@ -188,27 +396,51 @@ async def forward_cmd(client, message):
     except ValueError:
         return await message.reply(get_font("Start ID and End ID must be integers"))
 
-    keyboard = InlineKeyboardMarkup([
+    keyboard = forward_keyboard(from_chat, to_chat, start_id, end_id)
+    await message.reply(get_font("Select message type to forward"), reply_markup=keyboard)
+
+def forward_keyboard(from_chat, to_chat, start_id, end_id, opts=""):
+    # opts carries the selected options as flag letters: B = bulk mode,
+    # D = skip files the destination already holds
+    args = f"{from_chat}_{to_chat}_{start_id}_{end_id}_{opts}"
+    toggle = lambda flag: opts.replace(flag, "") if flag in opts else opts + flag
+    mode = f"📦 {get_font('Mode: Bulk (albums)')}" if "B" in opts else f"📋 {get_font('Mode: Copy')}"
+    dedup = f"🧹 {get_font('Skip duplicates: On')}" if "D" in opts else f"🧹 {get_font('Skip duplicates: Off')}"
+
+    return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton(f"✅ {get_font('All')}", callback_data=f"fwd_ALL_{from_chat}_{to_chat}_{start_id}_{end_id}"),
-            InlineKeyboardButton(get_font("Text"), callback_data=f"fwd_TEXT_{from_chat}_{to_chat}_{start_id}_{end_id}"),
-            InlineKeyboardButton(get_font("Photo"), callback_data=f"fwd_PHOTO_{from_chat}_{to_chat}_{start_id}_{end_id}")
+            InlineKeyboardButton(f"✅ {get_font('All')}", callback_data=f"fwd_ALL_{args}"),
+            InlineKeyboardButton(get_font("Text"), callback_data=f"fwd_TEXT_{args}"),
+            InlineKeyboardButton(get_font("Photo"), callback_data=f"fwd_PHOTO_{args}")
         ],
         [
-            InlineKeyboardButton(get_font("Video"), callback_data=f"fwd_VIDEO_{from_chat}_{to_chat}_{start_id}_{end_id}"),
-            InlineKeyboardButton(get_font("Audio"), callback_data=f"fwd_AUDIO_{from_chat}_{to_chat}_{start_id}_{end_id}"),
-            InlineKeyboardButton(get_font("Document"), callback_data=f"fwd_DOCUMENT_{from_chat}_{to_chat}_{start_id}_{end_id}")
+            InlineKeyboardButton(get_font("Video"), callback_data=f"fwd_VIDEO_{args}"),
+            InlineKeyboardButton(get_font("Audio"), callback_data=f"fwd_AUDIO_{args}"),
+            InlineKeyboardButton(get_font("Document"), callback_data=f"fwd_DOCUMENT_{args}")
+        ],
+        [
+            InlineKeyboardButton(mode, callback_data=f"fwd_OPT_{from_chat}_{to_chat}_{start_id}_{end_id}_{toggle('B')}"),
+            InlineKeyboardButton(dedup, callback_data=f"fwd_OPT_{from_chat}_{to_chat}_{start_id}_{end_id}_{toggle('D')}")
         ],
         [
             InlineKeyboardButton(f"❌ {get_font('Cancel')}", callback_data="fwd_CANCEL")
         ]
     ])
-    
-    await message.reply(get_font("Select message type to forward"), reply_markup=keyboard)
 
-@app.on_callback_query(filters.regex("^(fwd_|uni_|bot_)"))
+@app.on_callback_query(filters.regex("^(fwd_|uni_|bot_|usr_)"))
 async def callback_handler(client, query):
     data = query.data.split("_")
+
+    if data[0] == "usr":
+        if query.from_user.id not in ADMINS:
+            return await query.answer(get_font("Admins only"))
+        uid = int(data[2])
+        if data[1] == "NEXT":
+            text, keyboard = await users_page(after=uid)
+        else:
+            text, keyboard = await users_page(before=uid)
+        await query.message.edit(text, reply_markup=keyboard)
+        return await query.answer()
     
     if data[0] == "bot":
         if data[1] == "ABOUT":
@@ -224,11 +456,19 @@ async def callback_handler(client, query):
     if data[0] == "uni":
         if data[1] == "CANCEL":
             uniquifier.cancel(query.from_user.id)
+            if queue_enabled():
+                await job_queue.cancel_user(query.from_user.id)
             return await query.answer(get_font("Cancelling..."))
         return
 
     if data[1] == "STOP":
-        forwarder.stop()
+        if len(data) < 3:
+            return await query.answer(get_font("Job is no longer running"))
+        stopped = forwarder.stop(data[2])
+        if queue_enabled():
+            stopped = await job_queue.cancel(data[2]) or stopped
+        if not stopped:
+            return await query.answer(get_font("Job is no longer running"))
         return await query.answer(get_font("Stopping process"))
     
     if data[1] == "CANCEL":
@@ -240,16 +480,47 @@ async def callback_handler(client, query):
     to_chat = data[3]
     start_id = int(data[4])
     end_id = int(data[5])
-    
+    opts = data[6] if len(data) > 6 else ""
+
+    if msg_filter == "OPT":
+        await query.message.edit_reply_markup(forward_keyboard(from_chat, to_chat, start_id, end_id, opts))
+        return await query.answer()
+
+    mode = "BULK" if "B" in opts else "COPY"
+    dedup = "D" in opts
+    if queue_enabled():
+        job_id = await job_queue.enqueue(forward_spec(from_chat, to_chat, start_id, end_id, msg_filter, mode, dedup), query.message)
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(get_font("Stop/Cancel"), callback_data=f"fwd_STOP_{job_id}")]])
+        await query.message.edit(f"📥 {get_font('Queued job')} `{job_id}`, {get_font('waiting for a worker')}...", reply_markup=keyboard)
+        return await query.answer(get_font("Queued"))
+
     status_msg = await query.message.edit(f"⏳ {get_font('Initializing forwarding')}...")
-    asyncio.create_task(forwarder.start_forwarding(from_chat, to_chat, start_id, end_id, msg_filter, status_msg))
+    asyncio.create_task(forwarder.start_forwarding(from_chat, to_chat, start_id, end_id, msg_filter, status_msg, mode=mode, dedup=dedup))
 
 async def main():
+    if not await db.connect():
+        logger.warning("MONGO_URL not set, database features disabled.")
+    await force_sub.load()
     await app.start()
+    await session_pool.start()
     await start_web_server()
     asyncio.create_task(auto_pinger())
+    asyncio.create_task(watchdog.run())
+    asyncio.create_task(system_stats.run())
+    asyncio.create_task(force_sub.run())
+    restored = await mirror.load()
+    if restored:
+        logger.info(f"Restored {restored} mirror(s).")
+    if JOB_QUEUE and not queue_enabled():
+        logger.warning("JOB_QUEUE needs MONGO_URL, running jobs in this process.")
+    # With the job queue, workers take over interrupted jobs when their lease expires
+    if AUTO_RESUME and not queue_enabled():
+        resumed = await resume_jobs()
+        if resumed:
+            logger.info(f"Resumed {resumed} job(s) from checkpoints.")
     logger.info("Bot started!")
     await idle()
+    await session_pool.stop()
     await app.stop()
 
 if __name__ == "__main__":
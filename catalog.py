@@ -0,0 +1,117 @@
+import logging
+from database import db
+from chatcache import normalize_chat_id
+from sessions import session_pool
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MEDIA_KINDS = ["photo", "animation", "document", "video", "audio", "voice", "video_note", "sticker"]
+
+def describe(chat_id, msg):
+    entry = {"chat_id": chat_id, "msg_id": msg.id, "empty": bool(msg.empty)}
+    if msg.empty:
+        return entry
+    entry["text"] = bool(msg.text)
+    entry["kind"] = None
+    entry["file_unique_id"] = None
+    for kind in MEDIA_KINDS:
+        media = getattr(msg, kind, None)
+        if media is not None:
+            entry["kind"] = kind
+            entry["file_unique_id"] = str(media.file_unique_id)
+            break
+    entry["media_group_id"] = msg.media_group_id
+    return entry
+
+def entry_matches(entry, msg_filter):
+    # Mirrors forward.matches_filter for a catalog entry
+    if entry["empty"]:
+        return False
+    if msg_filter == "ALL":
+        return True
+    if msg_filter == "TEXT":
+        return entry.get("text", False)
+    return entry.get("kind") == msg_filter.lower()
+
+class MessageCatalog:
+    def __init__(self):
+        self.high_water = {} # chat_id: highest live message ID seen
+        self.pending_empty = {} # chat_id: empty IDs not yet known to be below high_water
+
+    async def lookup(self, chat_id, message_ids):
+        # Returns {msg_id: entry} for the IDs the catalog already knows
+        chat_id = normalize_chat_id(chat_id)
+        try:
+            docs = await db.get_catalog(chat_id, min(message_ids), max(message_ids))
+        except Exception as e:
+            logger.error(f"Catalog lookup error for {chat_id}: {e}")
+            return {}
+        wanted = set(message_ids)
+        return {doc["msg_id"]: doc for doc in docs if doc["msg_id"] in wanted}
+
+    async def record(self, chat_id, messages):
+        if db.catalog is None:
+            return
+        chat_id = normalize_chat_id(chat_id)
+        try:
+            await self.latest(chat_id)
+            entries = []
+            pending = self.pending_empty.setdefault(chat_id, set())
+            for msg in messages:
+                if not msg:
+                    continue
+                if msg.empty:
+                    # IDs past the newest post also come back empty, so an empty
+                    # ID is only recorded once a live message above it exists
+                    pending.add(msg.id)
+                    continue
+                entries.append(describe(chat_id, msg))
+                self.high_water[chat_id] = max(self.high_water[chat_id], msg.id)
+
+            high = self.high_water[chat_id]
+            settled = [i for i in pending if i < high]
+            pending.difference_update(settled)
+            entries.extend({"chat_id": chat_id, "msg_id": i, "empty": True} for i in settled)
+            await db.save_catalog(entries)
+        except Exception as e:
+            logger.error(f"Catalog record error for {chat_id}: {e}")
+
+    async def latest(self, chat_id):
+        # Highest live message ID the catalog has seen in the chat
+        chat_id = normalize_chat_id(chat_id)
+        if chat_id not in self.high_water:
+            self.high_water[chat_id] = await db.get_catalog_high_water(chat_id)
+        return self.high_water[chat_id]
+
+    async def scan(self, client, chat_id, batch_ids, job_id, kind):
+        # Catalog entries stand in for messages scanned before; only unknown
+        # IDs are fetched, in a single getMessages call
+        chat_id = normalize_chat_id(chat_id)
+        entries = await self.lookup(chat_id, batch_ids)
+        unknown = [i for i in batch_ids if i not in entries]
+        metrics.count(job_id, kind, "catalog_skipped", len(batch_ids) - len(unknown))
+        if not unknown:
+            return entries
+
+        try:
+            messages = await session_pool.fetch(chat_id, unknown, client)
+        except Exception as e:
+            logger.error(f"Fetch error for {chat_id} {unknown[0]}-{unknown[-1]}: {e}")
+            return entries
+
+        messages = [m for m in (messages if isinstance(messages, list) else [messages]) if m]
+        metrics.count(job_id, kind, "fetched", len(messages))
+        await self.record(chat_id, messages)
+        for msg in messages:
+            entries[msg.id] = describe(chat_id, msg)
+        return entries
+
+    async def mark_empty(self, chat_id, message_ids):
+        chat_id = normalize_chat_id(chat_id)
+        try:
+            await db.save_catalog([{"chat_id": chat_id, "msg_id": i, "empty": True} for i in message_ids])
+        except Exception as e:
+            logger.error(f"Catalog update error for {chat_id}: {e}")
+
+catalog = MessageCatalog()
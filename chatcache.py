@@ -0,0 +1,105 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from pyrogram import enums
+from ratelimit import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached chat lookup stays valid, and how many chats are kept
+CHAT_CACHE_TTL = 300
+CHAT_CACHE_SIZE = 256
+# Failed lookups and chats the bot does not administer are only kept this
+# long, so promoting the bot or a transient error clears within seconds
+FAILED_TTL = 5
+
+def normalize_chat_id(chat_id):
+    if isinstance(chat_id, str) and (chat_id.startswith("-100") or chat_id.isdigit()):
+        return int(chat_id)
+    return chat_id
+
+class ChatInfo:
+    def __init__(self, chat_id, chat=None, member=None, error=None):
+        self.chat_id = chat_id
+        self.type = chat.type if chat else None
+        self.username = chat.username if chat else None
+        self.invite_link = chat.invite_link if chat else None
+        self.status = member.status if member else None
+        self.privileges = member.privileges if member else None
+        # Set when the membership lookup failed, None if it succeeded
+        self.error = error
+        # Result of the send_chat_action fallback, filled in by check_admin
+        self.can_act = None
+        self.fetched = time.monotonic()
+
+    @property
+    def is_admin(self):
+        return self.status in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]
+
+    @property
+    def usable(self):
+        return self.error is None and self.is_admin
+
+    @property
+    def is_public_channel(self):
+        return self.type == enums.ChatType.CHANNEL and self.username is not None
+
+class ChatCache:
+    def __init__(self, ttl=CHAT_CACHE_TTL, maxsize=CHAT_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict() # chat_id: ChatInfo, least recently used first
+        self.locks = {}
+
+    async def get(self, client, chat_id):
+        chat_id = normalize_chat_id(chat_id)
+        info = self.lookup(chat_id)
+        if info is not None:
+            return info
+
+        # Concurrent job startups on the same chat share one lookup
+        lock = self.locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            info = self.lookup(chat_id)
+            if info is None:
+                info = await self.fetch(client, chat_id)
+                self.store(info)
+        self.locks.pop(chat_id, None)
+        return info
+
+    def lookup(self, chat_id):
+        info = self.entries.get(chat_id)
+        if info is None:
+            return None
+        ttl = self.ttl if info.usable else min(self.ttl, FAILED_TTL)
+        if time.monotonic() - info.fetched > ttl:
+            del self.entries[chat_id]
+            return None
+        self.entries.move_to_end(chat_id)
+        return info
+
+    def store(self, info):
+        self.entries[info.chat_id] = info
+        self.entries.move_to_end(info.chat_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, chat_id):
+        self.entries.pop(normalize_chat_id(chat_id), None)
+
+    async def fetch(self, client, chat_id):
+        # get_chat first also refreshes pyrogram's peer cache after a restart
+        chat = None
+        try:
+            chat = await scheduler.call("get_chat", chat_id, client.get_chat, chat_id)
+        except Exception:
+            pass
+
+        try:
+            member = await scheduler.call("get_chat_member", chat_id, client.get_chat_member, chat_id, "me")
+            return ChatInfo(chat_id, chat, member)
+        except Exception as e:
+            return ChatInfo(chat_id, chat, error=e)
+
+chat_cache = ChatCache()
@@ -1,5 +1,11 @@
 import os
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+# Users shown per /users page
+USERS_PAGE_SIZE = 50
 
 class Database:
     def __init__(self):
@@ -7,6 +13,12 @@ class Database:
         self.db = None
         self.users = None
         self.config = None
+        self.checkpoints = None
+        self.dedup = None
+        self.catalog = None
+        self.jobs = None
+        self.mirrors = None
+        self.phashes = None
 
     async def connect(self):
         mongo_url = os.environ.get("MONGO_URL")
@@ -16,6 +28,20 @@ class Database:
         self.db = self.client["forwarder_bot"]
         self.users = self.db["users"]
         self.config = self.db["config"]
+        await self.users.create_index("user_id", unique=True)
+        await self.config.create_index("key", unique=True)
+        self.checkpoints = self.db["checkpoints"]
+        self.dedup = self.db["dedup"]
+        await self.dedup.create_index([("chat_id", 1), ("file_unique_id", 1)], unique=True)
+        self.catalog = self.db["catalog"]
+        await self.catalog.create_index([("chat_id", 1), ("msg_id", 1)], unique=True)
+        self.jobs = self.db["jobs"]
+        await self.jobs.create_index([("state", 1), ("lease_expires", 1)])
+        await self.jobs.create_index("created")
+        self.mirrors = self.db["mirrors"]
+        await self.mirrors.create_index([("from_chat", 1), ("to_chat", 1)], unique=True)
+        # Perceptual hashes keyed by file_unique_id, shared by every chat
+        self.phashes = self.db["phashes"]
         return True
 
     async def add_user(self, user_id, name):
@@ -26,8 +52,31 @@ class Database:
         )
 
     async def get_all_users(self):
-        cursor = self.users.find({})
-        return await cursor.to_list(length=1000)
+        return [user async for user in self.iter_users()]
+
+    async def iter_users(self, batch_size=500):
+        # Streams users without holding the whole collection in memory
+        cursor = self.users.find({}, {"_id": 0, "user_id": 1, "name": 1}).batch_size(batch_size)
+        async for user in cursor:
+            yield user
+
+    async def count_users(self):
+        return await self.users.estimated_document_count()
+
+    async def get_users_page(self, after=None, before=None, limit=USERS_PAGE_SIZE):
+        # Keyset pagination on the user_id index: returns (users, has_prev, has_next)
+        projection = {"_id": 0, "user_id": 1, "name": 1}
+        if before is not None:
+            cursor = self.users.find({"user_id": {"$lt": before}}, projection).sort("user_id", DESCENDING).limit(limit + 1)
+            users = await cursor.to_list(length=limit + 1)
+            has_prev = len(users) > limit
+            users = users[:limit][::-1]
+            return users, has_prev, True
+
+        query = {"user_id": {"$gt": after}} if after is not None else {}
+        cursor = self.users.find(query, projection).sort("user_id", ASCENDING).limit(limit + 1)
+        users = await cursor.to_list(length=limit + 1)
+        return users[:limit], after is not None, len(users) > limit
 
     async def set_config(self, key, value):
         await self.config.update_one(
@@ -40,4 +89,192 @@ class Database:
         res = await self.config.find_one({"key": key})
         return res["value"] if res else None
 
+    async def save_checkpoint(self, job_id, data):
+        if self.checkpoints is None:
+            return
+        await self.checkpoints.update_one(
+            {"job_id": job_id},
+            {"$set": data},
+            upsert=True
+        )
+
+    async def delete_checkpoint(self, job_id):
+        if self.checkpoints is None:
+            return
+        await self.checkpoints.delete_one({"job_id": job_id})
+
+    async def get_checkpoint(self, job_id):
+        if self.checkpoints is None:
+            return None
+        return await self.checkpoints.find_one({"job_id": job_id})
+
+    async def get_checkpoints(self):
+        if self.checkpoints is None:
+            return []
+        cursor = self.checkpoints.find({})
+        return await cursor.to_list(length=None)
+
+    async def iter_dedup(self, chat_id):
+        if self.dedup is None:
+            return
+        cursor = self.dedup.find({"chat_id": chat_id}, {"_id": 0, "file_unique_id": 1, "msg_id": 1})
+        async for doc in cursor:
+            yield doc
+
+    async def find_dedup(self, chat_id, file_unique_id):
+        if self.dedup is None:
+            return None
+        return await self.dedup.find_one({"chat_id": chat_id, "file_unique_id": file_unique_id})
+
+    async def add_dedup(self, entries):
+        if self.dedup is None or not entries:
+            return
+        try:
+            await self.dedup.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            # Entries already indexed by another job are fine to skip
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def set_dedup(self, chat_id, file_unique_id, msg_id):
+        if self.dedup is None:
+            return
+        await self.dedup.update_one(
+            {"chat_id": chat_id, "file_unique_id": file_unique_id},
+            {"$set": {"msg_id": msg_id}},
+            upsert=True
+        )
+
+    async def get_phashes(self, file_unique_ids):
+        if self.phashes is None or not file_unique_ids:
+            return {}
+        cursor = self.phashes.find({"_id": {"$in": file_unique_ids}})
+        return {doc["_id"]: doc async for doc in cursor}
+
+    async def save_phashes(self, previews):
+        if self.phashes is None or not previews:
+            return
+        await self.phashes.bulk_write([
+            UpdateOne({"_id": uid}, {"$set": fields}, upsert=True)
+            for uid, fields in previews.items()
+        ], ordered=False)
+
+    async def get_catalog(self, chat_id, start_id, end_id):
+        if self.catalog is None:
+            return []
+        cursor = self.catalog.find(
+            {"chat_id": chat_id, "msg_id": {"$gte": start_id, "$lte": end_id}},
+            {"_id": 0}
+        )
+        return await cursor.to_list(length=None)
+
+    async def save_catalog(self, entries):
+        if self.catalog is None or not entries:
+            return
+        await self.catalog.bulk_write([
+            UpdateOne({"chat_id": e["chat_id"], "msg_id": e["msg_id"]}, {"$set": e}, upsert=True)
+            for e in entries
+        ], ordered=False)
+
+    async def get_catalog_high_water(self, chat_id):
+        if self.catalog is None:
+            return 0
+        doc = await self.catalog.find_one({"chat_id": chat_id, "empty": False}, sort=[("msg_id", DESCENDING)])
+        return doc["msg_id"] if doc else 0
+
+    async def enqueue_job(self, doc):
+        doc.update(state="queued", created=time.time(), owner=None, lease_expires=None, cancel=False, attempts=0)
+        await self.jobs.insert_one(doc)
+
+    async def claim_job(self, owner, lease):
+        # Atomically takes the oldest queued job, or a running one whose
+        # owner stopped renewing its lease
+        now = time.time()
+        await self.sweep_cancelled_jobs(now)
+        return await self.jobs.find_one_and_update(
+            {"cancel": False, "$or": [
+                {"state": "queued", "retry_at": {"$not": {"$gt": now}}},
+                {"state": "running", "lease_expires": {"$lt": now}}
+            ]},
+            {"$set": {"state": "running", "owner": owner, "lease_expires": now + lease}, "$inc": {"attempts": 1}},
+            sort=[("created", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew_job_lease(self, job_id, owner, lease, progress=None):
+        # Returns None once another worker has taken over the job
+        update = {"lease_expires": time.time() + lease}
+        if progress is not None:
+            update["progress"] = progress
+        return await self.jobs.find_one_and_update(
+            {"_id": job_id, "owner": owner, "state": "running"},
+            {"$set": update},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def requeue_job(self, query, retry_at=0):
+        # Workers leave the job alone until retry_at
+        result = await self.jobs.update_one(
+            dict(query, cancel=False),
+            {"$set": {"state": "queued", "owner": None, "lease_expires": None, "retry_at": retry_at}}
+        )
+        return result.modified_count
+
+    async def finish_job(self, job_id, owner, state, error=None):
+        await self.jobs.update_one(
+            {"_id": job_id, "owner": owner},
+            {"$set": {"state": state, "error": error, "finished": time.time(), "lease_expires": None}}
+        )
+
+    async def cancel_jobs(self, query):
+        # Queued jobs are cancelled here; running ones by their worker's heartbeat
+        query = dict(query, state={"$in": ["queued", "running"]})
+        ids = [doc["_id"] for doc in await self.jobs.find(query, {"_id": 1}).to_list(length=None)]
+        if not ids:
+            return []
+        await self.jobs.update_many({"_id": {"$in": ids}}, {"$set": {"cancel": True}})
+        await self.jobs.update_many({"_id": {"$in": ids}, "state": "queued"}, {"$set": {"state": "cancelled", "finished": time.time()}})
+        return ids
+
+    async def sweep_cancelled_jobs(self, now):
+        # Cancelled jobs whose worker died are never claimed again
+        query = {"state": "running", "cancel": True, "lease_expires": {"$lt": now}}
+        ids = [doc["_id"] for doc in await self.jobs.find(query, {"_id": 1}).to_list(length=None)]
+        if ids:
+            await self.jobs.update_many({"_id": {"$in": ids}}, {"$set": {"state": "cancelled", "finished": now}})
+            await self.checkpoints.delete_many({"job_id": {"$in": ids}})
+
+    async def get_jobs(self, states):
+        cursor = self.jobs.find({"state": {"$in": states}}).sort("created", ASCENDING)
+        return await cursor.to_list(length=None)
+
+    async def save_mirror(self, doc):
+        if self.mirrors is None:
+            return
+        await self.mirrors.update_one(
+            {"from_chat": doc["from_chat"], "to_chat": doc["to_chat"]},
+            {"$set": doc},
+            upsert=True
+        )
+
+    async def set_mirror_last_id(self, from_chat, to_chat, last_id):
+        if self.mirrors is None:
+            return
+        await self.mirrors.update_one({"from_chat": from_chat, "to_chat": to_chat}, {"$max": {"last_id": last_id}})
+
+    async def set_mirror_gaps(self, from_chat, to_chat, gaps):
+        if self.mirrors is None:
+            return
+        await self.mirrors.update_one({"from_chat": from_chat, "to_chat": to_chat}, {"$set": {"gaps": gaps}})
+
+    async def delete_mirror(self, from_chat, to_chat):
+        if self.mirrors is None:
+            return
+        await self.mirrors.delete_one({"from_chat": from_chat, "to_chat": to_chat})
+
+    async def get_mirrors(self):
+        if self.mirrors is None:
+            return []
+        return await self.mirrors.find({}, {"_id": 0}).to_list(length=None)
+
 db = Database()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import logging
+from array import array
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Pending index entries are written to MongoDB in batches of this size
+FLUSH_SIZE = 500
+# Media kinds deduplicated by file_unique_id
+FILE_TYPES = ["photo", "animation", "document", "video", "audio"]
+
+# Slots a digest table starts with, and the share it fills before doubling
+TABLE_SIZE = 1024
+TABLE_LOAD = 0.7
+
+def digest(file_unique_id):
+    # Fixed-width 64-bit key; 0 marks an empty table slot, so it is never used
+    return int.from_bytes(hashlib.blake2b(file_unique_id.encode(), digest_size=8).digest(), "big") or 1
+
+class DigestTable:
+    # digest -> msg_id in two flat arrays with open addressing: 16 bytes a
+    # slot instead of ~100 bytes for a dict entry of Python ints
+    def __init__(self, size=TABLE_SIZE):
+        self.keys = array("Q", bytes(8 * size))
+        self.values = array("q", bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def slot(self, key):
+        # Digests are already uniformly spread, so the low bits pick the slot
+        i = key & self.mask
+        while self.keys[i] and self.keys[i] != key:
+            i = (i + 1) & self.mask
+        return i
+
+    def get(self, key, default=None):
+        i = self.slot(key)
+        return self.values[i] if self.keys[i] else default
+
+    def __setitem__(self, key, value):
+        i = self.slot(key)
+        if not self.keys[i]:
+            if self.count + 1 > TABLE_LOAD * len(self.keys):
+                self.grow()
+                i = self.slot(key)
+            self.keys[i] = key
+            self.count += 1
+        self.values[i] = value
+
+    def grow(self):
+        keys, values = self.keys, self.values
+        self.__init__(len(keys) * 2)
+        for key, value in zip(keys, values):
+            if key:
+                self[key] = value
+
+def media_unique_id(msg):
+    # file_unique_id of a deduplicated media kind, None for anything else.
+    # It is the same for a message and all its copies.
+    for kind in FILE_TYPES:
+        media = getattr(msg, kind, None)
+        if media is not None:
+            return str(media.file_unique_id)
+    return None
+
+class DedupIndex:
+    def __init__(self):
+        self.chats = {} # chat_id: DigestTable of digest -> msg_id
+        self.pending = {} # chat_id: [entries not yet in MongoDB]
+        self.indexed = {} # chat_id: highest message ID scanned into the index
+        self.locks = {}
+
+    async def load(self, chat_id):
+        if chat_id in self.chats:
+            return self.chats[chat_id]
+        lock = self.locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            if chat_id not in self.chats:
+                index = DigestTable()
+                async for doc in db.iter_dedup(chat_id):
+                    index[digest(doc["file_unique_id"])] = doc["msg_id"]
+                self.chats[chat_id] = index
+                logger.info(f"Loaded {len(index)} dedup entries for {chat_id}")
+        return self.chats[chat_id]
+
+    async def check(self, chat_id, file_unique_id, msg_id):
+        # Returns the ID of the message already holding this file, or None
+        # after recording msg_id as its first occurrence
+        index = await self.load(chat_id)
+        original = index.get(digest(file_unique_id))
+        if original is None:
+            await self.add(chat_id, file_unique_id, msg_id)
+            return None
+        if original == msg_id:
+            return None
+        original = await self.find(chat_id, file_unique_id)
+        return None if original == msg_id else original
+
+    async def find(self, chat_id, file_unique_id):
+        # Returns the ID of the message holding this file without recording anything
+        index = await self.load(chat_id)
+        original = index.get(digest(file_unique_id))
+        if original is None or db.dedup is None:
+            return original
+
+        # Confirm digest hits against the stored id before acting on them
+        await self.flush(chat_id)
+        doc = await db.find_dedup(chat_id, file_unique_id)
+        if doc is None:
+            logger.warning(f"Dedup digest collision in {chat_id} for {file_unique_id}")
+            return None
+        return doc["msg_id"]
+
+    async def add(self, chat_id, file_unique_id, msg_id):
+        index = await self.load(chat_id)
+        index[digest(file_unique_id)] = msg_id
+        pending = self.pending.setdefault(chat_id, [])
+        pending.append({"chat_id": chat_id, "file_unique_id": file_unique_id, "msg_id": msg_id})
+        if len(pending) >= FLUSH_SIZE:
+            await self.flush(chat_id)
+
+    async def holds(self, msg, file_unique_id):
+        # True while msg still carries the file it was indexed for
+        return media_unique_id(msg) == file_unique_id
+
+    async def replace(self, chat_id, file_unique_id, msg_id):
+        # Makes msg_id the original once the indexed one turned out deleted
+        index = await self.load(chat_id)
+        index[digest(file_unique_id)] = msg_id
+        await self.flush(chat_id)
+        await db.set_dedup(chat_id, file_unique_id, msg_id)
+
+    async def indexed_to(self, chat_id):
+        # Messages up to this ID have been scanned into the chat's index
+        if chat_id not in self.indexed:
+            value = await db.get_config(f"dedup_indexed_{chat_id}") if db.config is not None else None
+            self.indexed[chat_id] = value or 0
+        return self.indexed[chat_id]
+
+    async def set_indexed(self, chat_id, msg_id):
+        await self.flush(chat_id)
+        self.indexed[chat_id] = msg_id
+        if db.config is not None:
+            await db.set_config(f"dedup_indexed_{chat_id}", msg_id)
+
+    async def flush(self, chat_id=None):
+        chat_ids = [chat_id] if chat_id is not None else list(self.pending)
+        for cid in chat_ids:
+            entries = self.pending.pop(cid, [])
+            try:
+                await db.add_dedup(entries)
+            except Exception as e:
+                logger.error(f"Dedup flush error for {cid}: {e}")
+                self.pending.setdefault(cid, []).extend(entries)
+
+dedup_index = DedupIndex()
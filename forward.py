@@ -1,160 +1,540 @@
 import asyncio
 import time
 import logging
-from pyrogram import enums
-from pyrogram.errors import FloodWait, ChatAdminRequired, UserNotParticipant
+from contextlib import aclosing
+from pyrogram import enums, raw
+from pyrogram.errors import ChatAdminRequired, UserNotParticipant
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from ratelimit import scheduler
+from jobs import registry, Checkpointer
+from progress import ProgressReporter, STATUS_INTERVAL
+from chatcache import chat_cache, normalize_chat_id
+from catalog import catalog, entry_matches
+import metrics
+from sessions import session_pool
+from sparse import scan_windows, latest_id, newest_id, MAX_MESSAGE_ID
+from dedup import dedup_index, media_unique_id, FILE_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of IDs accepted by a single messages.getMessages call
+FETCH_BATCH_SIZE = 200
+# Maximum number of IDs accepted by a single messages.forwardMessages call
+FORWARD_BATCH_SIZE = 100
+# Attempts at reading a window before the job stops at its checkpoint, and
+# the delay before the first retry, doubled after each one
+FETCH_ATTEMPTS = 4
+FETCH_RETRY_DELAY = 2
+
+# Small caps style font as requested, compiled once into a translation table
+FONT_TABLE = str.maketrans(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    "ᴀʙᴄᴅᴇғɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢᴀʙᴄᴅᴇғɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢ"
+)
+
 def get_font(text):
-    # Small caps style font as requested
-    fonts = {
-        'a': 'ᴀ', 'b': 'ʙ', 'c': 'ᴄ', 'd': 'ᴅ', 'e': 'ᴇ', 'f': 'ғ', 'g': 'ɢ', 'h': 'ʜ', 'i': 'ɪ',
-        'j': 'ᴊ', 'k': 'ᴋ', 'l': 'ʟ', 'm': 'ᴍ', 'n': 'ɴ', 'o': 'ᴏ', 'p': 'ᴘ', 'q': 'ǫ', 'r': 'ʀ',
-        's': 's', 't': 'ᴛ', 'u': 'ᴜ', 'v': 'ᴠ', 'w': 'ᴡ', 'x': 'x', 'y': 'ʏ', 'z': 'ᴢ',
-        'A': 'ᴀ', 'B': 'ʙ', 'C': 'ᴄ', 'D': 'ᴅ', 'E': 'ᴇ', 'F': 'ғ', 'G': 'ɢ', 'H': 'ʜ', 'I': 'ɪ',
-        'J': 'ᴊ', 'K': 'ᴋ', 'L': 'ʟ', 'M': 'ᴍ', 'N': 'ɴ', 'O': 'ᴏ', 'P': 'ᴘ', 'Q': 'ǫ', 'R': 'ʀ',
-        'S': 's', 'T': 'ᴛ', 'U': 'ᴜ', 'V': 'ᴠ', 'W': 'ᴡ', 'X': 'x', 'Y': 'ʏ', 'Z': 'ᴢ'
-    }
-    return "".join(fonts.get(c, c) for c in text)
+    return text.translate(FONT_TABLE)
+
+def matches_filter(msg, msg_filter):
+    if msg_filter == "ALL":
+        return True
+    if msg_filter == "TEXT":
+        return bool(msg.text)
+    if msg_filter == "PHOTO":
+        return msg.photo is not None
+    if msg_filter == "VIDEO":
+        return msg.video is not None
+    if msg_filter == "AUDIO":
+        return msg.audio is not None
+    if msg_filter == "DOCUMENT":
+        return msg.document is not None
+    return False
 
 class Forwarder:
-    def __init__(self, client):
+    def __init__(self, client, prefetch_depth=4, status_interval=STATUS_INTERVAL):
         self.client = client
-        self.is_running = False
-        self.stats = {}
+        self.prefetch_depth = prefetch_depth
+        self.status_interval = status_interval
 
     async def check_admin(self, chat_id):
-        try:
-            if isinstance(chat_id, str) and (chat_id.startswith("-100") or chat_id.isdigit()):
-                chat_id = int(chat_id)
-            
-            # Force refresh chat info to avoid cache issues after restart
-            try:
-                await self.client.get_chat(chat_id)
-            except Exception:
-                pass
+        info = await chat_cache.get(self.client, chat_id)
+        if info.error is None:
+            return info.is_admin
 
-            member = await self.client.get_chat_member(chat_id, "me")
-            return member.status in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]
-        except Exception as e:
-            logger.error(f"Admin check error for {chat_id}: {e}")
-            # Fallback: try to send a small action to verify permissions
+        logger.error(f"Admin check error for {chat_id}: {info.error}")
+        # Fallback: try to send a small action to verify permissions
+        if info.can_act is None:
             try:
-                await self.client.send_chat_action(chat_id, enums.ChatAction.TYPING)
-                return True
+                await scheduler.call("send_chat_action", info.chat_id, self.client.send_chat_action, info.chat_id, enums.ChatAction.TYPING)
+                info.can_act = True
             except Exception:
-                return False
+                info.can_act = False
+        return info.can_act
 
     async def is_public_channel(self, chat_id):
-        try:
-            chat = await self.client.get_chat(chat_id)
-            return chat.type == enums.ChatType.CHANNEL and chat.username is not None
-        except Exception:
-            return False
+        info = await chat_cache.get(self.client, chat_id)
+        return info.is_public_channel
+
+    async def start_forwarding(self, from_chat, to_chat, start_id, end_id, msg_filter, status_msg, mode="COPY", dedup=False, checkpoint=None, owner=None):
+        # Returns the first ID not known to be done: end_id + 1 once the job
+        # completes, the last saved cursor if it is refused, stopped or fails
+        # A checkpoint resumes the original range from its saved cursor. Jobs
+        # with an owner, e.g. a mirror's back-fill, are retried by it, not /resume.
+        cursor = checkpoint["cursor"] if checkpoint else start_id
+        done_to = end_id + 1
 
-    async def start_forwarding(self, from_chat, to_chat, start_id, end_id, msg_filter, status_msg):
         # Check if from_chat is public or if bot is admin
         is_from_public = await self.is_public_channel(from_chat)
         if not is_from_public and not await self.check_admin(from_chat):
-            return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Bot must be admin in private from channel or it must be a public channel')}")
+            await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Bot must be admin in private from channel or it must be a public channel')}")
+            return cursor
         
         # Bot MUST be admin in to_chat to post messages
         if not await self.check_admin(to_chat):
-            return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Make sure the bot is admin in to channel')}")
+            await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Make sure the bot is admin in to channel')}")
+            return cursor
 
-        self.is_running = True
-        self.stats = {
+        # IDs past the channel's newest post would only come back empty
+        end_id = max(await latest_id(self.client, from_chat, start_id, end_id), cursor - 1)
+        job = registry.register("forward", (str(from_chat), str(to_chat)), {
             "total": end_id - start_id + 1,
-            "processed": 0,
+            "processed": cursor - start_id,
             "start_id": start_id,
             "end_id": end_id,
             "from_chat": from_chat,
             "to_chat": to_chat,
             "start_time": time.time(),
-            "filter": msg_filter
-        }
+            "filter": msg_filter,
+            "mode": mode,
+            "dedup": dedup,
+            "skipped": checkpoint.get("skipped", 0) if checkpoint else 0,
+            "owner": owner
+        }, job_id=checkpoint["job_id"] if checkpoint else None)
+        if job is None:
+            await status_msg.edit(f"❌ {get_font('Error')}: {get_font('A forward between these chats is already running')}")
+            return cursor
 
-        for msg_id in range(start_id, end_id + 1):
-            if not self.is_running:
-                break
-            
+        checkpointer = Checkpointer(job.id)
+        await checkpointer.save(self.checkpoint_data(job, status_msg))
+
+        job.reporter = ProgressReporter(status_msg, lambda: self.render_status(job), self.status_interval)
+        queue = asyncio.Queue(maxsize=self.prefetch_depth)
+        prefetcher = asyncio.create_task(self.prefetch(job, from_chat, cursor, end_id, queue))
+
+        worker = self.bulk_worker if mode == "BULK" else self.copy_worker
+        try:
+            if dedup:
+                await self.index_destination(job, to_chat)
+            await worker(job, queue, to_chat, msg_filter, checkpointer, status_msg)
+        except ChatAdminRequired:
+            job.is_running = False
+            chat_cache.invalidate(from_chat)
+            chat_cache.invalidate(to_chat)
+            await checkpointer.clear()
+            await job.reporter.finish(f"❌ {get_font('Error')}: {get_font('Admin permissions lost during process')}")
+            return checkpointer.saved["cursor"] if checkpointer.saved else cursor
+        except Exception as e:
+            # The checkpoint is kept, so /resume continues where the job died
+            logger.error(f"Forward job {job.id} failed: {e}")
+            job.is_running = False
+            hint = f"\n{get_font('Use')} `/resume {job.id}` {get_font('to continue')}" if owner is None else ""
+            await job.reporter.finish(f"❌ {get_font('Error')}: {e}{hint}")
+            return checkpointer.saved["cursor"] if checkpointer.saved else cursor
+        finally:
+            prefetcher.cancel()
+            job.reporter.close()
+            registry.remove(job.id)
+            metrics.clear_queue_depth(job.id, "prefetch")
+            metrics.clear_job(job.id)
+            if dedup:
+                await dedup_index.flush(normalize_chat_id(to_chat))
+
+        await checkpointer.clear()
+
+        if job.is_running:
+            job.is_running = False
+            await job.reporter.finish(f"✅ {get_font('Forwarding Completed')}!")
+            # IDs past the clamped end_id are known to be empty
+            return done_to
+        await job.reporter.finish(f"🛑 {get_font('Forwarding Cancelled')}!")
+        return checkpointer.saved["cursor"] if checkpointer.saved else cursor
+
+    async def index_destination(self, job, to_chat):
+        # The destination's file_unique_id index is built once; later jobs only
+        # scan the posts added since, and copies are recorded as they succeed
+        chat_id = normalize_chat_id(to_chat)
+        start_id = await dedup_index.indexed_to(chat_id) + 1
+        # Unbounded, so not capped; an island of posts past a missed one is
+        # only left out of the index, at worst letting a duplicate through
+        end_id = await newest_id(self.client, to_chat, start_id, MAX_MESSAGE_ID, spacing=None)
+        if end_id < start_id:
+            return
+        await job.reporter.edit(f"🧹 {get_font('Indexing destination for duplicates')} {start_id}-{end_id}...", self.render_status(job)[1])
+
+        fetch = lambda ids: catalog.scan(self.client, chat_id, ids, job.id, "forward")
+        is_live = lambda entries: any(not e["empty"] for e in entries.values())
+        windows = scan_windows(self.client, chat_id, start_id, end_id, FETCH_BATCH_SIZE, fetch, max(1, len(session_pool)), is_live)
+        async with aclosing(windows):
+            async for batch_ids, entries in windows:
+                if not job.is_running:
+                    return
+                for entry in (entries or {}).values():
+                    if not entry["empty"] and entry["kind"] in FILE_TYPES:
+                        await dedup_index.check(chat_id, entry["file_unique_id"], entry["msg_id"])
+        await dedup_index.set_indexed(chat_id, end_id)
+
+    async def verify_index(self, job, messages):
+        # Index hits for a batch are checked against the destination in one
+        # call, so posts deleted or edited there since no longer count as
+        # copies. Returns {file_unique_id: msg_id} of the hits still in place.
+        to_chat = job.stats["to_chat"]
+        chat_id = normalize_chat_id(to_chat)
+        hits = {}
+        for msg in messages:
+            uid = media_unique_id(msg)
+            if uid is not None and uid not in hits:
+                original = await dedup_index.find(chat_id, uid)
+                if original is not None:
+                    hits[uid] = original
+
+        ids = sorted(set(hits.values()))
+        current = {}
+        for i in range(0, len(ids), FETCH_BATCH_SIZE):
+            for msg in await self.fetch_batch(to_chat, ids[i:i + FETCH_BATCH_SIZE]):
+                if msg and not msg.empty:
+                    current[msg.id] = media_unique_id(msg)
+
+        verified = {uid: original for uid, original in hits.items() if current.get(original) == uid}
+        metrics.count(job.id, "forward", "dedup_stale", len(hits) - len(verified))
+        return verified
+
+    async def is_duplicate(self, job, msg, verified, pending=()):
+        # True when the destination still holds msg's file: verified comes
+        # from verify_index and is kept up to date by record_copies
+        uid = media_unique_id(msg)
+        if uid is None:
+            return False
+        if uid in pending:
+            return True
+        original = await dedup_index.find(normalize_chat_id(job.stats["to_chat"]), uid)
+        return original is not None and verified.get(uid) == original
+
+    async def record_copies(self, job, sources, sent_ids, verified):
+        # Copies keep the source's file_unique_id, so sent_ids are indexed
+        # under their sources' files; a stale entry found by verify_index is
+        # replaced by the new copy
+        if len(sources) != len(sent_ids):
+            # Can't be paired up, at worst a later duplicate gets through
+            return
+        chat_id = normalize_chat_id(job.stats["to_chat"])
+        for msg, msg_id in zip(sources, sent_ids):
+            uid = media_unique_id(msg)
+            if uid is None:
+                continue
+            if await dedup_index.find(chat_id, uid) is None:
+                await dedup_index.add(chat_id, uid, msg_id)
+            else:
+                await dedup_index.replace(chat_id, uid, msg_id)
+            verified[uid] = msg_id
+
+    async def prefetch(self, job, from_chat, start_id, end_id, queue):
+        # Producer: reads ahead of the copy cursor, bounded by the queue depth.
+        # With worker sessions, one window per session is fetched in parallel.
+        # Gaps of deleted IDs are queued as a skip count instead of messages.
+        parallel = max(1, len(session_pool))
+        fetch = lambda ids: self.fetch_window(job, from_chat, ids)
+        windows = scan_windows(self.client, from_chat, start_id, end_id, FETCH_BATCH_SIZE, fetch, parallel, lambda result: result[1])
+        async with aclosing(windows):
+            try:
+                async for batch_ids, result in windows:
+                    if not job.is_running:
+                        break
+                    if result is None:
+                        await queue.put(len(batch_ids))
+                        metrics.count(job.id, "forward", "gap_skipped", len(batch_ids))
+                    else:
+                        await queue.put(result[0])
+                    metrics.set_queue_depth(job.id, "prefetch", queue.qsize())
+            except Exception as e:
+                # Raised again by the worker, stopping the job at its checkpoint
+                await queue.put(e)
+                return
+
+        await queue.put(None)
+
+    async def fetch_window(self, job, from_chat, batch_ids):
+        # Only fetch IDs the catalog doesn't know or knows to match the filter
+        msg_filter = job.stats["filter"]
+        known = await catalog.lookup(from_chat, batch_ids)
+        needed = [i for i in batch_ids if i not in known or entry_matches(known[i], msg_filter)]
+        live = any(not entry["empty"] for entry in known.values())
+        fetched = {}
+        if needed:
+            messages = await self.fetch_retrying(from_chat, needed, lambda: session_pool.fetch(from_chat, needed, self.client))
+            for msg in messages if isinstance(messages, list) else [messages]:
+                if msg:
+                    fetched[msg.id] = msg
+            await catalog.record(from_chat, fetched.values())
+        live = live or any(not m.empty for m in fetched.values())
+        metrics.count(job.id, "forward", "fetched", len(fetched))
+        metrics.count(job.id, "forward", "catalog_skipped", len(batch_ids) - len(needed))
+
+        if len(session_pool) and job.stats["mode"] == "COPY":
+            # file_ids are bound to the session that fetched them, so messages
+            # to copy are re-read by the main session; bulk mode only needs IDs
+            wanted = [m.id for m in fetched.values() if not m.empty and matches_filter(m, msg_filter)]
+            fetched = {}
+            if wanted:
+                messages = await self.fetch_retrying(from_chat, wanted, lambda: self.fetch_batch(from_chat, wanted))
+                fetched = {m.id: m for m in messages if m}
+
+        return [fetched.get(i) for i in batch_ids], live
+
+    async def fetch_retrying(self, from_chat, ids, fetch):
+        # A window that can't be read must not be counted as processed, so it
+        # is retried with backoff and the last error is raised to the job
+        for attempt in range(FETCH_ATTEMPTS):
             try:
-                msg = await self.client.get_messages(from_chat, msg_id)
-                if not msg or msg.empty:
-                    self.stats["processed"] += 1
-                    continue
-
-                should_forward = False
-                if msg_filter == "ALL":
-                    should_forward = True
-                elif msg_filter == "TEXT" and msg.text:
-                    should_forward = True
-                elif msg_filter == "PHOTO" and msg.photo:
-                    should_forward = True
-                elif msg_filter == "VIDEO" and msg.video:
-                    should_forward = True
-                elif msg_filter == "AUDIO" and msg.audio:
-                    should_forward = True
-                elif msg_filter == "DOCUMENT" and msg.document:
-                    should_forward = True
-
-                if should_forward:
-                    await msg.copy(to_chat)
-                
-                self.stats["processed"] += 1
-                
-                if self.stats["processed"] % 5 == 0 or self.stats["processed"] == self.stats["total"]:
-                    await self.update_status(status_msg)
-                
-            except FloodWait as e:
-                await asyncio.sleep(e.value)
+                return await fetch()
             except ChatAdminRequired:
-                self.is_running = False
-                return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Admin permissions lost during process')}")
-            except Exception:
-                self.stats["processed"] += 1
+                raise
+            except Exception as e:
+                if attempt == FETCH_ATTEMPTS - 1:
+                    raise
+                delay = FETCH_RETRY_DELAY * 2 ** attempt
+                logger.error(f"Fetch error for {from_chat} {ids[0]}-{ids[-1]}, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def copy_worker(self, job, queue, to_chat, msg_filter, checkpointer, status_msg):
+        # Consumer: batches arrive in ID order and are copied sequentially so
+        # the destination keeps the source ordering
+        while job.is_running:
+            messages = await queue.get()
+            metrics.set_queue_depth(job.id, "prefetch", queue.qsize())
+            if messages is None:
+                break
+            if isinstance(messages, Exception):
+                raise messages
+            if isinstance(messages, int):
+                # A gap of deleted IDs found by the prefetcher
+                job.stats["processed"] += messages
+                job.reporter.touch()
+                await checkpointer.maybe_save(job.stats["processed"], lambda: self.checkpoint_data(job, status_msg))
                 continue
 
-        if self.is_running:
-            self.is_running = False
-            await status_msg.edit(f"✅ {get_font('Forwarding Completed')}!")
-        else:
-            self.is_running = False
-            await status_msg.edit(f"🛑 {get_font('Forwarding Cancelled')}!")
+            verified = await self.verify_index(job, messages) if job.stats["dedup"] else {}
+            for msg in messages:
+                if not job.is_running:
+                    break
 
-    async def update_status(self, status_msg):
-        elapsed = int(time.time() - self.stats["start_time"])
-        progress = (self.stats["processed"] / self.stats["total"]) * 100
-        
-        if self.stats["processed"] > 0:
-            eta_sec = (elapsed / self.stats["processed"]) * (self.stats["total"] - self.stats["processed"])
-            eta = time.strftime("%Hh %Mm %Ss", time.gmtime(eta_sec))
-        else:
-            eta = "Calculating..."
+                if msg and not msg.empty and matches_filter(msg, msg_filter):
+                    if job.stats["dedup"] and await self.is_duplicate(job, msg, verified):
+                        job.stats["skipped"] += 1
+                        metrics.count(job.id, "forward", "dedup_skipped")
+                    else:
+                        try:
+                            sent = await self.copy_message(msg, to_chat)
+                            metrics.count(job.id, "forward", "copied")
+                            if job.stats["dedup"]:
+                                await self.record_copies(job, [msg], [sent.id], verified)
+                        except ChatAdminRequired:
+                            raise
+                        except Exception:
+                            pass
+
+                job.stats["processed"] += 1
+                job.reporter.touch()
+                await checkpointer.maybe_save(job.stats["processed"], lambda: self.checkpoint_data(job, status_msg))
+
+    async def bulk_worker(self, job, queue, to_chat, msg_filter, checkpointer, status_msg):
+        # Consumer for BULK mode: albums go out as one copy_media_group call and
+        # runs of other matching messages as multi-ID forwards without the
+        # author, so neither shows a "Forwarded from" header, as in COPY mode
+        from_chat = job.stats["from_chat"]
+        dedup = job.stats["dedup"]
+        run = []
+        album = []
+        run_files = set() # file_unique_ids queued in the run, not yet indexed
+        verified = {}
+
+        def skip(count):
+            job.stats["skipped"] += count
+            metrics.count(job.id, "forward", "dedup_skipped", count)
+
+        async def flush_run():
+            if run:
+                sent = await self.forward_run(job.id, from_chat, to_chat, [m.id for m in run])
+                if dedup:
+                    await self.record_copies(job, run, sent, verified)
+                run.clear()
+                run_files.clear()
+
+        async def flush_album():
+            if album:
+                if any(matches_filter(m, msg_filter) for m in album):
+                    # copy_media_group sends every part, so an album is only
+                    # skipped once all of it is already in the destination
+                    if dedup and all([await self.is_duplicate(job, m, verified) for m in album]):
+                        skip(len(album))
+                    else:
+                        sent = await self.copy_album(job.id, from_chat, to_chat, album)
+                        if dedup:
+                            await self.record_copies(job, album, [m.id for m in sent], verified)
+                album.clear()
+
+        while job.is_running:
+            messages = await queue.get()
+            metrics.set_queue_depth(job.id, "prefetch", queue.qsize())
+            if messages is None:
+                break
+            if isinstance(messages, Exception):
+                raise messages
+            if isinstance(messages, int):
+                # A gap of deleted IDs ends any open album
+                await flush_album()
+                await flush_run()
+                job.stats["processed"] += messages
+                job.reporter.touch()
+                await checkpointer.maybe_save(job.stats["processed"], lambda: self.checkpoint_data(job, status_msg))
+                continue
+
+            if dedup:
+                # An open album carries over from the previous batch
+                verified = await self.verify_index(job, album + messages)
+            for msg in messages:
+                if not job.is_running:
+                    break
+
+                live = msg and not msg.empty
+                if live and msg.media_group_id:
+                    if album and album[0].media_group_id != msg.media_group_id:
+                        await flush_album()
+                    # Keep destination order: earlier plain messages go first
+                    await flush_run()
+                    album.append(msg)
+                elif live:
+                    await flush_album()
+                    if not matches_filter(msg, msg_filter):
+                        pass
+                    elif dedup and await self.is_duplicate(job, msg, verified, run_files):
+                        skip(1)
+                    else:
+                        run.append(msg)
+                        if dedup:
+                            run_files.add(media_unique_id(msg))
+                        if len(run) >= FORWARD_BATCH_SIZE:
+                            await flush_run()
+
+                job.stats["processed"] += 1
+                job.reporter.touch()
+
+            if not job.is_running:
+                break
+
+            # An album may continue into the next batch, so only the run is
+            # flushed here and the checkpoint cursor stops at the open album
+            await flush_run()
+            cursor = album[0].id if album else None
+            await checkpointer.maybe_save(job.stats["processed"], lambda: self.checkpoint_data(job, status_msg, cursor))
+
+        if job.is_running:
+            await flush_album()
+            await flush_run()
+
+    async def forward_run(self, job_id, from_chat, to_chat, message_ids):
+        # Returns the IDs of the copies in order, [] if the run failed
+        try:
+            sent = await scheduler.call("forward_messages", to_chat, self.forward_messages, to_chat, from_chat, message_ids)
+            metrics.count(job_id, "forward", "copied", len(message_ids))
+            return sent
+        except ChatAdminRequired:
+            raise
+        except Exception as e:
+            logger.error(f"Forward error for {from_chat} {message_ids[0]}-{message_ids[-1]}: {e}")
+            return []
+
+    async def forward_messages(self, to_chat, from_chat, message_ids):
+        # Client.forward_messages can't drop the author in pyrogram 2.0.106,
+        # so the raw call is made instead; the new messages come back in order
+        updates = await self.client.invoke(raw.functions.messages.ForwardMessages(
+            to_peer=await self.client.resolve_peer(to_chat),
+            from_peer=await self.client.resolve_peer(from_chat),
+            id=message_ids,
+            random_id=[self.client.rnd_id() for _ in message_ids],
+            drop_author=True
+        ))
+        return [u.message.id for u in updates.updates if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))]
+
+    async def copy_album(self, job_id, from_chat, to_chat, album):
+        try:
+            sent = await scheduler.call("copy_media_group", to_chat, self.client.copy_media_group, to_chat, from_chat, album[0].id)
+            metrics.count(job_id, "forward", "copied", len(album))
+            return sent
+        except ChatAdminRequired:
+            raise
+        except Exception as e:
+            logger.error(f"Album copy error for {from_chat} {album[0].id}: {e}")
+            return []
+
+    def checkpoint_data(self, job, status_msg, cursor=None):
+        stats = job.stats
+        # IDs are processed strictly in order, so everything before the cursor is done
+        return {
+            "kind": "forward",
+            "from_chat": stats["from_chat"],
+            "to_chat": stats["to_chat"],
+            "start_id": stats["start_id"],
+            "end_id": stats["end_id"],
+            "cursor": cursor or stats["start_id"] + stats["processed"],
+            "processed": stats["processed"],
+            "filter": stats["filter"],
+            "mode": stats["mode"],
+            "dedup": stats["dedup"],
+            "skipped": stats["skipped"],
+            "owner": stats["owner"],
+            "status_chat": status_msg.chat.id,
+        }
+
+    async def fetch_batch(self, chat_id, message_ids):
+        # One getMessages call for the whole window
+        messages = await scheduler.call("get_messages", chat_id, self.client.get_messages, chat_id, message_ids)
+        return messages if isinstance(messages, list) else [messages]
+
+    async def copy_message(self, msg, to_chat):
+        return await scheduler.call("copy_message", to_chat, msg.copy, to_chat)
+
+    def render_status(self, job):
+        stats = job.stats
+        elapsed = int(time.time() - stats["start_time"])
+        progress = (stats["processed"] / stats["total"]) * 100
+
+        # Rate and ETA come from the recent window, not the whole-run average
+        job.window.add(stats["processed"])
+        speed = job.window.rate()
+        eta_sec = job.window.eta(stats["total"] - stats["processed"])
+        eta = time.strftime("%Hh %Mm %Ss", time.gmtime(eta_sec)) if eta_sec is not None else "Calculating..."
 
         elapsed_str = time.strftime("%Mm %Ss", time.gmtime(elapsed))
-        
+        skipped = f"**{get_font('Duplicates Skipped')}**: {stats['skipped']}\n" if stats["dedup"] else ""
+
         text = (
             f"**{get_font('Copy Message')}...**\n"
             f"**{get_font('Progress')}**: {progress:.2f}%\n"
-            f"**{get_font('Processed')}**: {self.stats['processed']}/{self.stats['total']}\n"
-            f"**{get_font('From Chat')}**: `{self.stats['from_chat']}`\n"
-            f"**{get_font('To Chat')}**: `{self.stats['to_chat']}`\n"
-            f"**{get_font('Start ID')}**: {self.stats['start_id']}\n"
-            f"**{get_font('End ID')}**: {self.stats['end_id']}\n"
-            f"**{get_font('Type')}**: {self.stats['filter']}\n"
+            f"**{get_font('Processed')}**: {stats['processed']}/{stats['total']}\n"
+            f"**{get_font('From Chat')}**: `{stats['from_chat']}`\n"
+            f"**{get_font('To Chat')}**: `{stats['to_chat']}`\n"
+            f"**{get_font('Start ID')}**: {stats['start_id']}\n"
+            f"**{get_font('End ID')}**: {stats['end_id']}\n"
+            f"**{get_font('Type')}**: {stats['filter']}\n"
+            f"**{get_font('Mode')}**: {stats['mode']}\n"
+            f"{skipped}"
+            f"**{get_font('Speed')}**: {speed:.1f} {get_font('msg/s')}\n"
             f"**{get_font('ETA')}**: {eta}\n"
             f"**{get_font('Elapsed')}**: {elapsed_str}"
         )
         
-        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(get_font("Stop/Cancel"), callback_data="fwd_STOP")]])
-        
-        try:
-            await status_msg.edit(text, reply_markup=keyboard)
-        except:
-            pass
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(get_font("Stop/Cancel"), callback_data=f"fwd_STOP_{job.id}")]])
+        return text, keyboard
 
-    def stop(self):
-        self.is_running = False
+    def stop(self, job_id):
+        return registry.stop(job_id)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from itertools import islice, takewhile
+from pyrogram import enums
+from pyrogram.errors import UserNotParticipant
+from database import db
+from ratelimit import scheduler
+from chatcache import chat_cache, normalize_chat_id
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a membership result stays valid; users missing a channel are
+# re-checked sooner so joining unlocks the bot quickly
+MEMBER_TTL = 900
+NEGATIVE_TTL = 60
+# Users remembered at most, least recently active dropped first
+MEMBER_CACHE_SIZE = 100000
+# Seconds between background passes and users re-checked per pass
+RECHECK_INTERVAL = 30
+RECHECK_BATCH = 100
+
+class Membership:
+    def __init__(self, missing):
+        self.missing = missing # channels the user has not joined
+        self.checked = time.monotonic()
+        self.seen = self.checked # last time a message asked for it
+
+    @property
+    def ttl(self):
+        return NEGATIVE_TTL if self.missing else MEMBER_TTL
+
+    def age(self, now):
+        return now - self.checked
+
+class ForceSub:
+    def __init__(self, client, maxsize=MEMBER_CACHE_SIZE):
+        self.client = client
+        self.maxsize = maxsize
+        self.channels = [] # kept in memory, only read from MongoDB at startup
+        self.members = OrderedDict() # user_id: Membership, least recently used first
+        self.links = {} # channel: join URL
+        self.locks = {}
+
+    async def load(self):
+        if db.config is not None:
+            self.channels = [normalize_chat_id(c) for c in await db.get_config("fsub_channels") or []]
+        return self.channels
+
+    async def set_channels(self, channels):
+        self.channels = [normalize_chat_id(c) for c in channels]
+        self.members.clear()
+        self.links.clear()
+        if db.config is not None:
+            await db.set_config("fsub_channels", channels)
+
+    async def missing(self, user_id):
+        # Channels the user still has to join; a cache hit costs a dict lookup
+        if not self.channels:
+            return []
+        entry = self.lookup(user_id)
+        if entry is not None:
+            metrics.FSUB_LOOKUPS.labels("cache").inc()
+            return entry.missing
+
+        # A burst of messages from one user shares one lookup
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            entry = self.lookup(user_id)
+            if entry is None:
+                entry = await self.fetch(user_id)
+                self.store(user_id, entry)
+        self.locks.pop(user_id, None)
+        return entry.missing
+
+    def lookup(self, user_id):
+        entry = self.members.get(user_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry.age(now) > entry.ttl:
+            del self.members[user_id]
+            return None
+        entry.seen = now
+        self.members.move_to_end(user_id)
+        return entry
+
+    def store(self, user_id, entry):
+        self.members[user_id] = entry
+        self.members.move_to_end(user_id)
+        while len(self.members) > self.maxsize:
+            self.members.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self.members.pop(user_id, None)
+
+    async def fetch(self, user_id):
+        metrics.FSUB_LOOKUPS.labels("api").inc()
+        results = await asyncio.gather(*(self.is_member(channel, user_id) for channel in self.channels))
+        return Membership([channel for channel, joined in zip(self.channels, results) if not joined])
+
+    async def is_member(self, channel, user_id):
+        try:
+            member = await scheduler.call("get_chat_member", channel, self.client.get_chat_member, channel, user_id)
+        except UserNotParticipant:
+            return False
+        except Exception as e:
+            # A misconfigured channel must not lock everyone out of the bot
+            logger.error(f"Force sub check failed for {channel}: {e}")
+            return True
+        return member.status not in [enums.ChatMemberStatus.LEFT, enums.ChatMemberStatus.BANNED]
+
+    def on_member_update(self, update):
+        # Join/leave updates arrive for channels the bot administers
+        if update.chat.id in self.channels:
+            user = (update.new_chat_member or update.old_chat_member).user
+            self.invalidate(user.id)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(RECHECK_INTERVAL)
+            try:
+                await self.recheck()
+            except Exception as e:
+                logger.error(f"Force sub recheck failed: {e}")
+
+    async def recheck(self):
+        # Refresh-ahead: entries past half their TTL that were used since their
+        # last check are re-checked in one batch, so active users rarely wait
+        # on a lookup in the handler and idle ones cost nothing
+        if not self.channels:
+            return
+        now = time.monotonic()
+        # Most recently used first; entries unused for a whole TTL have expired
+        recent = takewhile(lambda item: now - item[1].seen <= MEMBER_TTL, reversed(self.members.items()))
+        due = list(islice((
+            uid for uid, entry in recent
+            if entry.seen > entry.checked and entry.age(now) > entry.ttl / 2
+        ), RECHECK_BATCH))
+        if not due:
+            return
+        entries = await asyncio.gather(*(self.fetch(uid) for uid in due))
+        for uid, entry in zip(due, entries):
+            # Users that went idle and were evicted meanwhile stay evicted
+            if uid in self.members:
+                self.members[uid] = entry
+        logger.debug(f"Force sub re-checked {len(due)} user(s)")
+
+    async def join_links(self, channels):
+        urls = []
+        for channel in channels:
+            if channel not in self.links:
+                info = await chat_cache.get(self.client, channel)
+                if info.username:
+                    self.links[channel] = f"https://t.me/{info.username}"
+                elif info.invite_link:
+                    self.links[channel] = info.invite_link
+                else:
+                    # An extra link: exporting one would revoke the primary
+                    # link the owner may have shared elsewhere
+                    try:
+                        link = await scheduler.call("create_chat_invite_link", channel, self.client.create_chat_invite_link, channel)
+                        self.links[channel] = link.invite_link
+                    except Exception as e:
+                        logger.error(f"Invite link error for {channel}: {e}")
+                        continue
+            urls.append(self.links[channel])
+        return urls
@@ -0,0 +1,97 @@
+import asyncio
+import sys
+import time
+import logging
+import threading
+import traceback
+import psutil
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds the loop may go without running the heartbeat before it counts as
+# blocked and the blocking stack is captured
+LAG_THRESHOLD = 0.5
+# Seconds between loop heartbeats
+HEARTBEAT_INTERVAL = 0.1
+# Seconds between system stat samples
+SAMPLE_INTERVAL = 10
+
+class Watchdog:
+    def __init__(self, threshold=LAG_THRESHOLD, interval=HEARTBEAT_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.last_beat = time.monotonic()
+        self.lag = 0.0
+        self.loop_thread = None
+        self.stalls = 0
+        self.last_stall = None
+        self.stopped = threading.Event()
+
+    async def run(self):
+        # The heartbeat runs on the loop; the watcher runs in a thread so it
+        # still wakes up while something is blocking the loop
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                started = time.monotonic()
+                self.last_beat = started
+                await asyncio.sleep(self.interval)
+                self.lag = max(0.0, time.monotonic() - started - self.interval)
+                metrics.LOOP_LAG.set(self.lag)
+        finally:
+            self.stopped.set()
+
+    def watch(self):
+        reported = None
+        while not self.stopped.wait(self.interval):
+            beat = self.last_beat
+            lag = time.monotonic() - beat - self.interval
+            # One report per stall, taken while the blocking code is still running
+            if lag < self.threshold or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stalls += 1
+            self.last_stall = {"time": time.time(), "lag": round(lag, 3), "stack": stack}
+            metrics.LOOP_STALLS.inc()
+            logger.warning(f"Event loop blocked for {lag:.2f}s:\n{stack}")
+
+    def snapshot(self):
+        return {
+            "lag": round(self.lag, 3),
+            "threshold": self.threshold,
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+        }
+
+class SystemStats:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.cpu = 0.0
+        self.ram = 0.0
+        self.disk = 0.0
+        self.sampled = None
+
+    def sample(self):
+        # psutil calls block (cpu_percent for a full second), so this runs in
+        # a worker thread and handlers only read the cached values
+        self.cpu = psutil.cpu_percent(interval=1)
+        self.ram = psutil.virtual_memory().percent
+        self.disk = psutil.disk_usage('/').percent
+        self.sampled = time.time()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except Exception as e:
+                logger.error(f"System stats sample failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self):
+        return {"cpu": self.cpu, "ram": self.ram, "disk": self.disk, "sampled": self.sampled}
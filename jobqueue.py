@@ -0,0 +1,162 @@
+import asyncio
+import time
+import uuid
+import logging
+from database import db
+from jobs import registry
+from forward import get_font
+
+logger = logging.getLogger(__name__)
+
+# A claimed job belongs to its worker for LEASE_SECONDS; the worker renews the
+# lease every HEARTBEAT_INTERVAL and other workers take over once it expires
+LEASE_SECONDS = 90
+HEARTBEAT_INTERVAL = 20
+# Seconds an idle worker waits before polling for new jobs again
+POLL_INTERVAL = 3
+# A job that stops before its range is done, e.g. refused because the same
+# chats are busy or failed on an error, is queued again after RETRY_DELAY
+# seconds until it has been claimed MAX_ATTEMPTS times, then marked failed
+RETRY_DELAY = 60
+MAX_ATTEMPTS = 5
+
+# Queued jobs use the checkpoint format: a fresh job is a checkpoint at
+# start_id, so workers start new jobs and take over old ones the same way
+
+def forward_spec(from_chat, to_chat, start_id, end_id, msg_filter, mode, dedup=False):
+    return {
+        "kind": "forward",
+        "from_chat": from_chat,
+        "to_chat": to_chat,
+        "start_id": start_id,
+        "end_id": end_id,
+        "cursor": start_id,
+        "processed": 0,
+        "filter": msg_filter,
+        "mode": mode,
+        "dedup": dedup,
+    }
+
+def uniquify_spec(user_id, chat_id, delay, start_id, end_id, near=0):
+    return {
+        "kind": "uniquify",
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "delay": delay,
+        "near": near,
+        "start_id": start_id,
+        "end_id": end_id,
+        "cursor": start_id,
+        "scanned": 0,
+        "duplicates": 0,
+    }
+
+async def run_job(forwarder, uniquifier, spec, status_msg):
+    # Runs a job from a checkpoint document; True once its whole range is done
+    if spec["kind"] == "forward":
+        done_to = await forwarder.start_forwarding(
+            spec["from_chat"], spec["to_chat"], spec["start_id"], spec["end_id"], spec["filter"], status_msg,
+            mode=spec.get("mode", "COPY"), dedup=spec.get("dedup", False), checkpoint=spec
+        )
+        return done_to > spec["end_id"]
+    elif spec["kind"] == "uniquify":
+        return await uniquifier.start_purge(spec["user_id"], spec["start_id"], spec["end_id"], status_msg, checkpoint=spec)
+    else:
+        raise ValueError(f"Unknown job kind {spec['kind']}")
+
+class JobQueue:
+    async def enqueue(self, spec, status_msg):
+        job_id = uuid.uuid4().hex[:8]
+        spec = dict(spec, job_id=job_id, status_chat=status_msg.chat.id)
+        await db.enqueue_job({"_id": job_id, "spec": spec, "status_msg_id": status_msg.id})
+        return job_id
+
+    async def cancel(self, job_id):
+        return bool(await db.cancel_jobs({"_id": job_id}))
+
+    async def retry(self, job_id):
+        # Queues a failed job again; it continues from its checkpoint
+        return bool(await db.requeue_job({"_id": job_id, "state": "failed"}))
+
+    async def cancel_user(self, user_id):
+        return bool(await db.cancel_jobs({"spec.kind": "uniquify", "spec.user_id": user_id}))
+
+    async def active(self):
+        return await db.get_jobs(["queued", "running"])
+
+class JobWorker:
+    def __init__(self, client, forwarder, uniquifier, owner, concurrency=1):
+        self.client = client
+        self.forwarder = forwarder
+        self.uniquifier = uniquifier
+        self.owner = owner
+        self.slots = asyncio.Semaphore(concurrency)
+        self.tasks = set()
+
+    async def run(self):
+        while True:
+            await self.slots.acquire()
+            try:
+                doc = await db.claim_job(self.owner, LEASE_SECONDS)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                doc = None
+            if doc is None:
+                self.slots.release()
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            task = asyncio.create_task(self.execute(doc))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def execute(self, doc):
+        job_id = doc["_id"]
+        heartbeat = asyncio.create_task(self.heartbeat(doc))
+        try:
+            # A job taken over from a dead worker continues from its checkpoint
+            spec = await db.get_checkpoint(job_id) or doc["spec"]
+            logger.info(f"Worker {self.owner} running job {job_id} (attempt {doc['attempts']}) from ID {spec['cursor']}")
+            status_msg = await self.client.get_messages(spec["status_chat"], doc["status_msg_id"])
+            if status_msg.empty:
+                status_msg = await self.client.send_message(spec["status_chat"], f"⏳ {get_font('Resuming job')} `{job_id}`...")
+            completed = await run_job(self.forwarder, self.uniquifier, spec, status_msg)
+            if heartbeat.done():
+                await db.finish_job(job_id, self.owner, "cancelled")
+            elif completed:
+                await db.finish_job(job_id, self.owner, "done")
+            elif doc["attempts"] < MAX_ATTEMPTS:
+                logger.warning(f"Job {job_id} stopped before completing, retried in {RETRY_DELAY}s")
+                await db.requeue_job({"_id": job_id, "owner": self.owner}, time.time() + RETRY_DELAY)
+            else:
+                await db.finish_job(job_id, self.owner, "failed", error=f"stopped before completing after {doc['attempts']} attempts")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await db.finish_job(job_id, self.owner, "failed", error=str(e))
+        finally:
+            heartbeat.cancel()
+            self.slots.release()
+
+    async def heartbeat(self, doc):
+        # Renews the lease and relays cancellation; returns once the job must stop
+        job_id = doc["_id"]
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            job = registry.get(job_id)
+            progress = {"processed": job.stats["processed"], "total": job.stats["total"]} if job else None
+            try:
+                current = await db.renew_job_lease(job_id, self.owner, LEASE_SECONDS, progress)
+            except Exception as e:
+                # Keep running; the lease only lapses if renewals keep failing
+                logger.error(f"Lease renewal failed for {job_id}: {e}")
+                continue
+            if current is None:
+                logger.warning(f"Worker {self.owner} lost the lease on job {job_id}")
+            elif not current["cancel"]:
+                continue
+            if doc["spec"]["kind"] == "forward":
+                self.forwarder.stop(job_id)
+            else:
+                self.uniquifier.cancel(doc["spec"]["user_id"])
+            return
+
+job_queue = JobQueue()
@@ -0,0 +1,92 @@
+import time
+import logging
+import uuid
+from database import db
+from progress import RateWindow
+
+logger = logging.getLogger(__name__)
+
+# Persist job progress after this many messages or seconds, whichever comes first
+CHECKPOINT_EVERY = 500
+CHECKPOINT_INTERVAL = 30
+
+class Job:
+    def __init__(self, job_id, kind, key, stats):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.stats = stats
+        self.is_running = True
+        self.start_time = time.time()
+        self.window = RateWindow()
+        self.reporter = None
+
+    def throughput(self):
+        self.window.add(self.stats.get("processed", 0))
+        return self.window.rate()
+
+class Checkpointer:
+    def __init__(self, job_id, every=CHECKPOINT_EVERY, interval=CHECKPOINT_INTERVAL):
+        self.job_id = job_id
+        self.every = every
+        self.interval = interval
+        self.last_count = 0
+        self.last_time = time.time()
+        self.saved = None # last data that reached the database
+
+    def is_due(self, count):
+        return count - self.last_count >= self.every or time.time() - self.last_time >= self.interval
+
+    async def maybe_save(self, count, build):
+        # build is only called when a checkpoint is actually due
+        if self.is_due(count):
+            await self.save(build(), count)
+
+    async def save(self, data, count=None):
+        data["job_id"] = self.job_id
+        data["updated"] = time.time()
+        try:
+            await db.save_checkpoint(self.job_id, data)
+        except Exception as e:
+            # A missed checkpoint only costs re-work on resume, never the job
+            logger.error(f"Checkpoint error for {self.job_id}: {e}")
+            return
+        if count is not None:
+            self.last_count = count
+        self.last_time = time.time()
+        self.saved = data
+
+    async def clear(self):
+        try:
+            await db.delete_checkpoint(self.job_id)
+        except Exception as e:
+            logger.error(f"Checkpoint cleanup error for {self.job_id}: {e}")
+
+class JobRegistry:
+    def __init__(self):
+        self.jobs = {} # job_id: Job
+
+    def register(self, kind, key, stats, job_id=None):
+        # Only one live job per key (e.g. a from/to chat pair) at a time
+        if any(job.key == key for job in self.jobs.values()):
+            return None
+        job = Job(job_id or uuid.uuid4().hex[:8], kind, key, stats)
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stop(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            job.is_running = False
+        return job is not None
+
+    def remove(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    def list(self, kind=None):
+        return [job for job in self.jobs.values() if kind is None or job.kind == kind]
+
+registry = JobRegistry()
@@ -0,0 +1,73 @@
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+MESSAGES = Counter(
+    "forwarder_messages_total",
+    "Messages handled by jobs",
+    ["job", "kind", "action"]
+)
+API_LATENCY = Histogram(
+    "forwarder_api_latency_seconds",
+    "Telegram API call latency, excluding rate limiter waits",
+    ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+RATE_WAIT = Counter(
+    "forwarder_rate_wait_seconds_total",
+    "Seconds calls spent waiting for a rate limiter token",
+    ["method"]
+)
+FLOOD_WAITS = Counter(
+    "forwarder_flood_waits_total",
+    "FloodWait errors received",
+    ["method"]
+)
+FLOOD_SECONDS = Counter(
+    "forwarder_flood_wait_seconds_total",
+    "Seconds slept because of FloodWait",
+    ["method"]
+)
+QUEUE_DEPTH = Gauge(
+    "forwarder_queue_depth",
+    "Items waiting in a job queue",
+    ["job", "queue"]
+)
+LOOP_LAG = Gauge(
+    "forwarder_event_loop_lag_seconds",
+    "How late the event loop woke up for the last lag probe"
+)
+LOOP_STALLS = Counter(
+    "forwarder_event_loop_stalls_total",
+    "Times the event loop was blocked past the watchdog threshold"
+)
+FSUB_LOOKUPS = Counter(
+    "forwarder_fsub_lookups_total",
+    "Force-subscribe membership checks by where the answer came from",
+    ["source"]
+)
+
+# job_id: (kind, action) label pairs counted for it, removed when the job ends
+job_labels = {}
+
+def count(job_id, kind, action, amount=1):
+    MESSAGES.labels(job_id, kind, action).inc(amount)
+    job_labels.setdefault(job_id, set()).add((kind, action))
+
+def clear_job(job_id):
+    for kind, action in job_labels.pop(job_id, ()):
+        try:
+            MESSAGES.remove(job_id, kind, action)
+        except KeyError:
+            pass
+
+def set_queue_depth(job_id, queue, depth):
+    QUEUE_DEPTH.labels(job_id, queue).set(depth)
+
+def clear_queue_depth(job_id, queue):
+    try:
+        QUEUE_DEPTH.remove(job_id, queue)
+    except KeyError:
+        pass
+
+async def metrics_handler(request):
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
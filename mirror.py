@@ -0,0 +1,271 @@
+import asyncio
+import logging
+from pyrogram.errors import ChatAdminRequired
+from database import db
+from ratelimit import scheduler
+from chatcache import chat_cache, normalize_chat_id
+from forward import matches_filter, get_font, FORWARD_BATCH_SIZE
+from sparse import next_live, newest_id, MAX_MESSAGE_ID
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds new posts are collected before a flush; album parts arrive as
+# separate updates within this window
+MIRROR_FLUSH_DELAY = 1.0
+# A back-fill after downtime looks at most this many IDs past the last mirrored one
+BACKFILL_LIMIT = 1000000
+# Seconds before back-fill gaps that did not complete are tried again; the
+# wait doubles up to GAP_RETRY_MAX while a round makes no progress
+GAP_RETRY_INTERVAL = 300
+GAP_RETRY_MAX = 6 * 3600
+
+class MirrorLink:
+    def __init__(self, doc):
+        self.from_chat = doc["from_chat"]
+        self.to_chat = doc["to_chat"]
+        self.filter = doc["filter"]
+        self.mode = doc["mode"]
+        self.last_id = doc["last_id"]
+        self.status_chat = doc["status_chat"]
+        self.id = f"mirror_{self.from_chat}_{self.to_chat}"
+        self.buffer = {} # msg_id: Message waiting for the next flush
+        self.flusher = None
+        self.backfilling = False
+        # copy_media_group sends the whole album, so later parts are skipped
+        self.copied_group = None
+        # [first, last] ID ranges of back-fills that did not complete, retried
+        # in the background; last is None until a live post bounds it
+        self.gaps = doc.get("gaps", [])
+        self.retrier = None
+
+    def to_doc(self):
+        return {
+            "from_chat": self.from_chat,
+            "to_chat": self.to_chat,
+            "filter": self.filter,
+            "mode": self.mode,
+            "last_id": self.last_id,
+            "status_chat": self.status_chat,
+            "gaps": self.gaps,
+        }
+
+class Mirror:
+    def __init__(self, client, forwarder, flush_delay=MIRROR_FLUSH_DELAY):
+        self.client = client
+        self.forwarder = forwarder
+        self.flush_delay = flush_delay
+        self.links = {} # from_chat: {to_chat: MirrorLink}
+
+    def is_source(self, chat_id):
+        return chat_id in self.links
+
+    def list(self):
+        return [link for targets in self.links.values() for link in targets.values()]
+
+    async def load(self):
+        # Restores saved mirrors and back-fills what was posted while offline
+        for doc in await db.get_mirrors():
+            link = MirrorLink(doc)
+            self.links.setdefault(link.from_chat, {})[link.to_chat] = link
+            asyncio.create_task(self.backfill(link))
+        return len(self.list())
+
+    async def add(self, from_chat, to_chat, msg_filter, mode, status_msg):
+        # Channel posts only reach bots that are admins of the channel
+        if not await self.forwarder.check_admin(from_chat):
+            return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Bot must be admin in the source chat to mirror it')}")
+        if not await self.forwarder.check_admin(to_chat):
+            return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('Make sure the bot is admin in to channel')}")
+
+        chat = await scheduler.call("get_chat", from_chat, self.client.get_chat, normalize_chat_id(from_chat))
+        from_chat, to_chat = chat.id, normalize_chat_id(to_chat)
+        if to_chat in self.links and from_chat in self.links[to_chat]:
+            return await status_msg.edit(f"❌ {get_font('Error')}: {get_font('The destination already mirrors into the source')}")
+
+        # Only posts after this one are mirrored. The search has no upper
+        # bound, so it is not capped; missing an island only back-fills it.
+        last_id = await newest_id(self.client, from_chat, 1, MAX_MESSAGE_ID, spacing=None)
+        link = MirrorLink({
+            "from_chat": from_chat,
+            "to_chat": to_chat,
+            "filter": msg_filter,
+            "mode": mode,
+            "last_id": last_id,
+            "status_chat": status_msg.chat.id,
+        })
+        old = self.links.setdefault(from_chat, {}).get(to_chat)
+        if old and old.flusher:
+            old.flusher.cancel()
+        if old and old.retrier:
+            old.retrier.cancel()
+        self.links[from_chat][to_chat] = link
+        await db.save_mirror(link.to_doc())
+        await status_msg.edit(
+            f"🔁 {get_font('Mirroring')} `{from_chat}` → `{to_chat}`\n"
+            f"**{get_font('Filter')}**: {msg_filter} | **{get_font('Mode')}**: {mode}\n"
+            f"**{get_font('After ID')}**: {last_id}"
+        )
+
+    async def remove(self, from_chat, to_chat=None):
+        from_chat = normalize_chat_id(from_chat)
+        targets = self.links.get(from_chat, {})
+        removed = [link for link in list(targets.values()) if to_chat is None or link.to_chat == normalize_chat_id(to_chat)]
+        for link in removed:
+            if link.flusher:
+                link.flusher.cancel()
+            if link.retrier:
+                link.retrier.cancel()
+            targets.pop(link.to_chat, None)
+            metrics.clear_job(link.id)
+            await db.delete_mirror(link.from_chat, link.to_chat)
+        if not targets:
+            self.links.pop(from_chat, None)
+        return len(removed)
+
+    async def on_message(self, message):
+        if message.service or message.empty:
+            return
+        for link in list(self.links.get(message.chat.id, {}).values()):
+            link.buffer[message.id] = message
+            if not link.backfilling and (link.flusher is None or link.flusher.done()):
+                link.flusher = asyncio.create_task(self.run_flusher(link))
+
+    async def run_flusher(self, link):
+        # Micro-batching: wait for the burst to settle, then copy it in ID order
+        while link.buffer and not link.backfilling:
+            await asyncio.sleep(self.flush_delay)
+            try:
+                await self.flush(link)
+            except ChatAdminRequired:
+                chat_cache.invalidate(link.from_chat)
+                chat_cache.invalidate(link.to_chat)
+                logger.error(f"Mirror {link.from_chat} -> {link.to_chat} lost admin rights")
+            except Exception as e:
+                logger.error(f"Mirror flush error for {link.from_chat} -> {link.to_chat}: {e}")
+
+    async def flush(self, link):
+        # Posts already covered by a back-fill are dropped
+        messages = sorted((m for m in link.buffer.values() if m.id > link.last_id), key=lambda m: m.id)
+        link.buffer.clear()
+        if not messages:
+            return
+        open_gaps = [gap for gap in link.gaps if gap[1] is None]
+        for gap in open_gaps:
+            # An open gap ends right before the first post mirrored live
+            gap[1] = messages[0].id - 1
+        if open_gaps:
+            await db.set_mirror_gaps(link.from_chat, link.to_chat, link.gaps)
+
+        run = []
+        album = []
+
+        async def flush_run():
+            if run:
+                await self.forwarder.forward_run(link.id, link.from_chat, link.to_chat, [m.id for m in run])
+                run.clear()
+
+        async def flush_album():
+            if album:
+                if any(matches_filter(m, link.filter) for m in album):
+                    await self.forwarder.copy_album(link.id, link.from_chat, link.to_chat, album)
+                link.copied_group = album[0].media_group_id
+                album.clear()
+
+        for msg in messages:
+            if msg.media_group_id and msg.media_group_id == link.copied_group:
+                continue
+            if msg.media_group_id:
+                if album and album[0].media_group_id != msg.media_group_id:
+                    await flush_album()
+                await flush_run()
+                album.append(msg)
+                continue
+
+            await flush_album()
+            if not matches_filter(msg, link.filter):
+                continue
+            if link.mode == "BULK":
+                run.append(msg)
+                if len(run) >= FORWARD_BATCH_SIZE:
+                    await flush_run()
+            else:
+                try:
+                    await self.forwarder.copy_message(msg, link.to_chat)
+                    metrics.count(link.id, "forward", "copied")
+                except ChatAdminRequired:
+                    raise
+                except Exception as e:
+                    logger.error(f"Mirror copy error for {link.from_chat} {msg.id}: {e}")
+        await flush_album()
+        await flush_run()
+
+        link.last_id = messages[-1].id
+        await db.set_mirror_last_id(link.from_chat, link.to_chat, link.last_id)
+
+    async def copy_range(self, link, start_id, end_id):
+        # Returns the first ID not copied, like start_forwarding
+        status_msg = await self.client.send_message(
+            link.status_chat,
+            f"🔁 {get_font('Back-filling mirror')} `{link.from_chat}` → `{link.to_chat}` {start_id}-{end_id}..."
+        )
+        return await self.forwarder.start_forwarding(
+            link.from_chat, link.to_chat, start_id, end_id, link.filter, status_msg, mode=link.mode, owner=link.id
+        )
+
+    async def backfill(self, link):
+        # Live posts are held back until the gap is copied, keeping the order.
+        # A back-fill that does not complete leaves a gap retried in the
+        # background, so last_id keeps moving with the live posts.
+        link.backfilling = True
+        start_id = link.last_id + 1
+        first, end_id = start_id, None # what is left to copy
+        try:
+            if await next_live(self.client, link.from_chat, start_id, start_id + BACKFILL_LIMIT) is None:
+                first = None
+            else:
+                end_id = await newest_id(self.client, link.from_chat, start_id, start_id + BACKFILL_LIMIT)
+                first = await self.copy_range(link, start_id, end_id)
+        except Exception as e:
+            logger.error(f"Mirror back-fill error for {link.from_chat} -> {link.to_chat}: {e}")
+        try:
+            if end_id is not None and end_id > link.last_id:
+                link.last_id = end_id
+                await db.set_mirror_last_id(link.from_chat, link.to_chat, end_id)
+            if first is not None and (end_id is None or first <= end_id):
+                # Where an open gap ends is only known once a live post arrives
+                link.gaps.append([first, end_id])
+                logger.warning(f"Mirror back-fill {link.from_chat} -> {link.to_chat} stopped at {first}, retrying in the background")
+                await db.set_mirror_gaps(link.from_chat, link.to_chat, link.gaps)
+        except Exception as e:
+            logger.error(f"Mirror state save error for {link.from_chat} -> {link.to_chat}: {e}")
+        finally:
+            link.backfilling = False
+            if link.buffer:
+                link.flusher = asyncio.create_task(self.run_flusher(link))
+            if link.gaps and (link.retrier is None or link.retrier.done()):
+                link.retrier = asyncio.create_task(self.retry_gaps(link))
+
+    async def retry_gaps(self, link):
+        delay = GAP_RETRY_INTERVAL
+        while link.gaps:
+            await asyncio.sleep(delay)
+            before = [list(gap) for gap in link.gaps]
+            for gap in list(link.gaps):
+                try:
+                    if gap[1] is None:
+                        # No live post since: the gap runs up to the newest one
+                        newest = await newest_id(self.client, link.from_chat, gap[0], gap[0] + BACKFILL_LIMIT)
+                        if gap[1] is None:
+                            gap[1] = newest
+                            link.last_id = max(link.last_id, newest)
+                            await db.set_mirror_last_id(link.from_chat, link.to_chat, newest)
+                    done_to = await self.copy_range(link, gap[0], gap[1]) if gap[0] <= gap[1] else gap[1] + 1
+                    if done_to > gap[1]:
+                        link.gaps.remove(gap)
+                    else:
+                        gap[0] = done_to
+                    await db.set_mirror_gaps(link.from_chat, link.to_chat, link.gaps)
+                except Exception as e:
+                    logger.error(f"Mirror gap retry error for {link.from_chat} -> {link.to_chat} {gap}: {e}")
+            delay = GAP_RETRY_INTERVAL if link.gaps != before else min(delay * 2, GAP_RETRY_MAX)
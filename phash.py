@@ -0,0 +1,283 @@
+import io
+import os
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from PIL import Image
+from database import db
+from ratelimit import scheduler
+from dedup import dedup_index, media_unique_id
+
+logger = logging.getLogger(__name__)
+
+# Media kinds compared by thumbnail; audio covers say nothing about the file
+NEAR_TYPES = ["photo", "animation", "document", "video"]
+# Videos, animations and documents often share a cover (episodes of a series,
+# a preview photo posted before its video), so beyond photos a close thumbnail
+# only counts with a file size within this fraction and, for kinds that have
+# one, a duration within this many seconds
+NEAR_SIZE_TOLERANCE = 0.05
+NEAR_DURATION_TOLERANCE = 1
+# Largest Hamming distance /near accepts. Searches run on the event loop and
+# past this the probes per query grow quickly (~0.4ms at 8 with 300k hashes)
+MAX_NEAR_THRESHOLD = 8
+# Processes hashing thumbnails; decoding images would block the event loop
+HASH_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Thumbnail downloads in flight at once
+DOWNLOAD_CONCURRENCY = 8
+# Dedup entries whose hashes are read from MongoDB per query when loading a chat
+LOAD_BATCH_SIZE = 1000
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+def dhash(data):
+    # 64-bit difference hash: brightness gradients across a 9x8 greyscale
+    # thumbnail, stable under re-encoding and resizing. Runs in a worker process.
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def thumbnail(msg):
+    # file_id of the smallest preview of a message's media, None without one
+    for kind in NEAR_TYPES:
+        media = getattr(msg, kind, None)
+        if media is None:
+            continue
+        if media.thumbs:
+            return media.thumbs[0].file_id
+        return media.file_id if kind == "photo" else None
+    return None
+
+# MongoDB stores signed 64-bit integers
+def to_stored(value):
+    return value - (1 << HASH_BITS) if value is not None and value >= 1 << (HASH_BITS - 1) else value
+
+def from_stored(value):
+    return value & HASH_MASK if value is not None else None
+
+class HammingIndex:
+    # Multi-index hashing: hashes are split into CHUNKS chunks. Two hashes
+    # within distance r differ in at most r // CHUNKS bits of some chunk, so a
+    # query only compares the buckets near its own chunks instead of every hash
+    CHUNKS = 3
+
+    def __init__(self):
+        widths = [HASH_BITS // self.CHUNKS + (i < HASH_BITS % self.CHUNKS) for i in range(self.CHUNKS)]
+        self.widths = widths
+        self.spans = [(sum(widths[:i]), (1 << w) - 1) for i, w in enumerate(widths)] # (shift, mask)
+        self.tables = [{} for _ in range(self.CHUNKS)] # chunk value: [(hash, item)]
+        self.items = {} # item: hash
+        self.flips = {} # (chunk, chunk radius): XOR masks to probe
+
+    def __len__(self):
+        return len(self.items)
+
+    def chunks(self, value):
+        return [(value >> shift) & mask for shift, mask in self.spans]
+
+    def masks(self, chunk, radius):
+        key = (chunk, radius)
+        if key not in self.flips:
+            bits = [1 << b for b in range(self.widths[chunk])]
+            self.flips[key] = [sum(c) for r in range(radius + 1) for c in combinations(bits, r)]
+        return self.flips[key]
+
+    def add(self, value, item):
+        if item in self.items:
+            return
+        self.items[item] = value
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            table.setdefault(chunk, []).append((value, item))
+
+    def remove(self, item):
+        value = self.items.pop(item, None)
+        if value is None:
+            return
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            bucket = table[chunk]
+            bucket.remove((value, item))
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value, radius, below=None, accept=None):
+        # Returns an item within radius bits of value, or None; with below,
+        # only items smaller than it count, with accept only items it passes
+        for i, (table, chunk) in enumerate(zip(self.tables, self.chunks(value))):
+            for mask in self.masks(i, radius // self.CHUNKS):
+                for other, item in table.get(chunk ^ mask, ()):
+                    if (below is None or item < below) and (value ^ other).bit_count() <= radius and (accept is None or accept(item)):
+                        return item
+        return None
+
+# Thumbnail hash of a file with the evidence compared beyond photos
+Preview = namedtuple("Preview", ["kind", "hash", "size", "duration"])
+
+def preview_fields(msg, value):
+    # Cached fields for msg's media with thumbnail hash value, None if it has none
+    for kind in NEAR_TYPES:
+        media = getattr(msg, kind, None)
+        if media is not None:
+            return {"kind": kind, "hash": to_stored(value), "size": getattr(media, "file_size", None), "duration": getattr(media, "duration", None)}
+    return {"kind": None, "hash": None, "size": None, "duration": None}
+
+def from_doc(doc):
+    # Preview from cached fields, None for media without a thumbnail
+    if doc.get("hash") is None:
+        return None
+    return Preview(doc.get("kind"), from_stored(doc["hash"]), doc.get("size"), doc.get("duration"))
+
+def similar(a, b, threshold):
+    # True when a and b are near-duplicates: the same kind, thumbnails within
+    # threshold bits and, beyond photos, a matching size and duration
+    if a is None or b is None or a.kind != b.kind or (a.hash ^ b.hash).bit_count() > threshold:
+        return False
+    if a.kind == "photo":
+        return True
+    if not a.size or not b.size or abs(a.size - b.size) > NEAR_SIZE_TOLERANCE * max(a.size, b.size):
+        return False
+    if a.duration is None and b.duration is None:
+        return True
+    return a.duration is not None and b.duration is not None and abs(a.duration - b.duration) <= NEAR_DURATION_TOLERANCE
+
+def add_kept(kinds, kept, value, msg_id):
+    kinds.setdefault(value.kind, HammingIndex()).add(value.hash, msg_id)
+    if value.kind != "photo":
+        kept[msg_id] = value
+
+class NearIndex:
+    def __init__(self, workers=HASH_WORKERS):
+        self.workers = workers
+        self.chats = {} # chat_id: {kind: HammingIndex} of the media kept in the chat
+        self.kept = {} # chat_id: {msg_id: Preview} of the kept media beyond photos
+        self.locks = {}
+        self.executor = None
+        self.downloads = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async def load(self, chat_id):
+        # Built from the chat's dedup index and the cached hashes of its files
+        if chat_id in self.chats:
+            return self.chats[chat_id]
+        lock = self.locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            if chat_id not in self.chats:
+                await dedup_index.flush(chat_id)
+                kinds, kept = {}, {}
+                batch = []
+                async for doc in db.iter_dedup(chat_id):
+                    batch.append(doc)
+                    if len(batch) >= LOAD_BATCH_SIZE:
+                        await self.load_batch(kinds, kept, batch)
+                        batch = []
+                await self.load_batch(kinds, kept, batch)
+                self.kept[chat_id] = kept
+                self.chats[chat_id] = kinds
+                logger.info(f"Loaded {sum(map(len, kinds.values()))} perceptual hashes for {chat_id}")
+        return self.chats[chat_id]
+
+    async def load_batch(self, kinds, kept, docs):
+        cached = await db.get_phashes([doc["file_unique_id"] for doc in docs])
+        for doc in docs:
+            value = from_doc(cached.get(doc["file_unique_id"], {}))
+            if value is not None and value.kind is not None:
+                add_kept(kinds, kept, value, doc["msg_id"])
+
+    def discard(self, chat_id, msg_id):
+        for index in self.chats[chat_id].values():
+            index.remove(msg_id)
+        self.kept[chat_id].pop(msg_id, None)
+
+    async def check(self, chat_id, file_unique_id, msg_id, value, threshold):
+        # Like DedupIndex.check, but a near-duplicate of a kept file (see
+        # similar) is a duplicate too. Near-duplicates are not indexed.
+        original = await dedup_index.find(chat_id, file_unique_id)
+        if original is not None and original != msg_id:
+            return original
+        if value is not None:
+            kinds = await self.load(chat_id)
+            kept = self.kept[chat_id]
+            index = kinds.setdefault(value.kind, HammingIndex())
+            accept = None if value.kind == "photo" else lambda item: similar(value, kept.get(item), threshold)
+            # Only earlier messages count as originals, so re-scanning kept media
+            # with a larger threshold deletes the later copy of a pair, not both
+            near = index.search(value.hash, threshold, below=msg_id, accept=accept)
+            if near is not None:
+                self.discard(chat_id, msg_id)
+                return near
+            add_kept(kinds, kept, value, msg_id)
+        if original is None:
+            await dedup_index.add(chat_id, file_unique_id, msg_id)
+        return None
+
+    async def holds(self, client, chat_id, msg, file_unique_id, value, threshold):
+        # True while msg still carries the file or a near-duplicate of value;
+        # msg was just read by client, so its thumbnail can be hashed
+        uid = media_unique_id(msg)
+        if uid is None or value is None:
+            return uid is not None and uid == file_unique_id
+        if uid == file_unique_id:
+            return True
+        cached = (await db.get_phashes([uid])).get(uid, {})
+        fields = cached if "kind" in cached else preview_fields(msg, await self.hash_message(client, chat_id, msg))
+        return similar(value, from_doc(fields), threshold)
+
+    async def replace(self, chat_id, file_unique_id, msg_id, value, stale):
+        # Makes msg_id the kept copy once the original it matched turned out deleted
+        kinds = await self.load(chat_id)
+        self.discard(chat_id, stale)
+        if value is not None:
+            add_kept(kinds, self.kept[chat_id], value, msg_id)
+        if await dedup_index.find(chat_id, file_unique_id) in (None, stale):
+            await dedup_index.replace(chat_id, file_unique_id, msg_id)
+
+    async def hashes(self, client, chat_id, entries):
+        # {file_unique_id: Preview or None} for catalog entries; thumbnails
+        # are only downloaded for files no earlier scan has hashed
+        msg_ids = {}
+        for entry in entries:
+            msg_ids.setdefault(entry["file_unique_id"], entry["msg_id"])
+        uids = {msg_id: uid for uid, msg_id in msg_ids.items()}
+        cached = await db.get_phashes(list(msg_ids))
+        # Entries cached before kinds were recorded are hashed again
+        known = {uid: from_doc(doc) for uid, doc in cached.items() if "kind" in doc}
+        missing = [msg_id for uid, msg_id in msg_ids.items() if uid not in known]
+        if not missing:
+            return known
+
+        # file_ids are bound to the session that fetched them, so thumbnails
+        # come from messages read by the client that downloads them
+        messages = await scheduler.call("get_messages", chat_id, client.get_messages, chat_id, missing)
+        messages = [m for m in (messages if isinstance(messages, list) else [messages]) if m and not m.empty]
+        results = await asyncio.gather(*(self.hash_message(client, chat_id, m) for m in messages), return_exceptions=True)
+        computed = {}
+        for msg, result in zip(messages, results):
+            if isinstance(result, Exception):
+                # Not cached, so the next scan tries again
+                logger.error(f"Thumbnail hash error for {chat_id} {msg.id}: {result}")
+                continue
+            computed[uids[msg.id]] = preview_fields(msg, result)
+        try:
+            await db.save_phashes(computed)
+        except Exception as e:
+            logger.error(f"Hash cache save error for {chat_id}: {e}")
+        known.update({uid: from_doc(fields) for uid, fields in computed.items()})
+        return known
+
+    async def hash_message(self, client, chat_id, msg):
+        # None marks media without a preview, so it is not downloaded again
+        file_id = thumbnail(msg)
+        if file_id is None:
+            return None
+        async with self.downloads:
+            data = await scheduler.call("download_media", chat_id, client.download_media, file_id, in_memory=True)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, dhash, bytes(data.getbuffer()))
+
+near_index = NearIndex()
@@ -0,0 +1,82 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from ratelimit import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two edits of the same status message
+STATUS_INTERVAL = 5
+# Rates and ETAs are computed over this many recent seconds
+RATE_WINDOW = 60
+
+class RateWindow:
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.samples = deque() # (monotonic time, count)
+
+    def add(self, count):
+        now = time.monotonic()
+        self.samples.append((now, count))
+        # Keep one sample older than the window so the span covers all of it
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return 0.0
+        (t0, c0), (t1, c1) = self.samples[0], self.samples[-1]
+        return (c1 - c0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def eta(self, remaining):
+        rate = self.rate()
+        return remaining / rate if rate > 0 else None
+
+class ProgressReporter:
+    def __init__(self, message, render, interval=STATUS_INTERVAL):
+        # render() -> (text, reply_markup) is only called when an edit is due
+        self.message = message
+        self.render = render
+        self.interval = interval
+        self.last_text = None
+        self.last_edit = 0.0
+        self.dirty = False
+        self.task = None
+
+    def touch(self):
+        # Cheap enough to call for every processed message
+        self.dirty = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self.dirty:
+            delay = self.interval - (time.monotonic() - self.last_edit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.dirty = False
+            await self.flush()
+
+    async def flush(self):
+        text, reply_markup = self.render()
+        await self.edit(text, reply_markup)
+
+    async def edit(self, text, reply_markup=None):
+        if text == self.last_text:
+            return
+        self.last_text = text
+        self.last_edit = time.monotonic()
+        try:
+            await scheduler.call("edit_message", self.message.chat.id, self.message.edit, text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.debug(f"Status edit failed: {e}")
+
+    def close(self):
+        self.dirty = False
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def finish(self, text, reply_markup=None):
+        self.close()
+        await self.edit(text, reply_markup)
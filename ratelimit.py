@@ -0,0 +1,131 @@
+import asyncio
+import time
+import logging
+from pyrogram.errors import FloodWait
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Starting and ceiling rates (calls per second) for method-wide buckets
+METHOD_RATES = {
+    "get_messages": 30,
+    "copy_message": 20,
+    "delete_messages": 20,
+    "edit_message": 5,
+    "get_chat": 20,
+    "get_chat_member": 20,
+}
+DEFAULT_METHOD_RATE = 20
+# Per-chat buckets start lower since Telegram limits bursts into one chat
+CHAT_RATE = 5
+CHAT_MAX_RATE = 10
+# Calls posting into a chat get their own per-chat bucket: Telegram allows
+# about one message a second into a chat (20 a minute in groups)
+SEND_METHODS = {"copy_message", "copy_media_group", "forward_messages", "edit_message"}
+SEND_CHAT_RATE = 1
+SEND_CHAT_MAX_RATE = 2
+MIN_RATE = 0.2
+# AIMD: halve on FloodWait, grow by ~INCREASE calls/s for every second of success.
+# After a flood growth slows to FLOOD_INCREASE and stops at FLOOD_HEADROOM of
+# the rate that flooded, until FLOOD_MEMORY seconds pass without another one
+DECREASE_FACTOR = 0.5
+INCREASE = 0.5
+FLOOD_INCREASE = 0.05
+FLOOD_HEADROOM = 0.8
+FLOOD_MEMORY = 600
+
+class TokenBucket:
+    def __init__(self, rate, max_rate):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.flood_rate = None # rate the last FloodWait hit at
+        self.flooded = 0.0
+
+    def reserve(self):
+        # Takes a token now and returns how long the caller must wait for it.
+        # Tokens may go negative, which queues callers behind each other.
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def on_success(self):
+        if self.flood_rate is not None and time.monotonic() - self.flooded > FLOOD_MEMORY:
+            self.flood_rate = None
+        if self.flood_rate is None:
+            ceiling, increase = self.max_rate, INCREASE
+        else:
+            ceiling, increase = min(self.max_rate, self.flood_rate * FLOOD_HEADROOM), FLOOD_INCREASE
+        self.rate = max(self.rate, min(ceiling, self.rate + increase / self.rate))
+        self.capacity = max(1.0, self.rate)
+
+    def on_flood(self, seconds=0):
+        self.flood_rate = self.rate
+        self.flooded = time.monotonic()
+        self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = min(self.tokens, 0.0)
+        if seconds:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class RateScheduler:
+    def __init__(self):
+        self.method_buckets = {}
+        self.chat_buckets = {}
+        self.flood_waits = 0
+        self.flood_seconds = 0
+
+    # Flood limits are per account, so every bucket is also keyed by session
+    def method_bucket(self, method, session="main"):
+        key = (session, method)
+        if key not in self.method_buckets:
+            rate = METHOD_RATES.get(method, DEFAULT_METHOD_RATE)
+            self.method_buckets[key] = TokenBucket(rate, rate)
+        return self.method_buckets[key]
+
+    def chat_bucket(self, chat_id, session="main", method=None):
+        send = method in SEND_METHODS
+        key = (session, str(chat_id), send)
+        if key not in self.chat_buckets:
+            if send:
+                self.chat_buckets[key] = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_MAX_RATE)
+            else:
+                self.chat_buckets[key] = TokenBucket(CHAT_RATE, CHAT_MAX_RATE)
+        return self.chat_buckets[key]
+
+    async def call(self, method, chat_id, func, *args, session="main", **kwargs):
+        # Every API call of every job goes through here so concurrent jobs
+        # share one budget and FloodWaits slow everyone down, not just the caller
+        method_bucket = self.method_bucket(method, session)
+        chat_bucket = self.chat_bucket(chat_id, session, method)
+        while True:
+            wait = max(method_bucket.reserve(), chat_bucket.reserve())
+            if wait > 0:
+                metrics.RATE_WAIT.labels(method).inc(wait)
+                await asyncio.sleep(wait)
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood_waits += 1
+                self.flood_seconds += e.value
+                metrics.FLOOD_WAITS.labels(method).inc()
+                metrics.FLOOD_SECONDS.labels(method).inc(e.value)
+                logger.warning(f"FloodWait {e.value}s on {method} for {chat_id} ({session})")
+                # FloodWait is raised per method, so the whole method pauses
+                method_bucket.on_flood(e.value)
+                chat_bucket.on_flood()
+                continue
+            finally:
+                metrics.API_LATENCY.labels(method).observe(time.monotonic() - started)
+            method_bucket.on_success()
+            chat_bucket.on_success()
+            return result
+
+scheduler = RateScheduler()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from collections import deque
+from ratelimit import scheduler
+
+logger = logging.getLogger(__name__)
+
+class SessionPool:
+    def __init__(self):
+        self.clients = [] # (session name, client)
+        self.index = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add(self, name, client):
+        self.clients.append((name, client))
+
+    def next(self):
+        name, client = self.clients[self.index % len(self.clients)]
+        self.index += 1
+        return name, client
+
+    async def fetch(self, chat_id, message_ids, fallback):
+        # Scanning reads go to the next worker session; the main client is
+        # used when there are no workers or the worker can't see the chat
+        if not self.clients:
+            return await scheduler.call("get_messages", chat_id, fallback.get_messages, chat_id, message_ids)
+
+        name, client = self.next()
+        try:
+            return await scheduler.call("get_messages", chat_id, client.get_messages, chat_id, message_ids, session=name)
+        except Exception as e:
+            logger.warning(f"Worker {name} fetch failed for {chat_id}, using main session: {e}")
+            return await scheduler.call("get_messages", chat_id, fallback.get_messages, chat_id, message_ids)
+
+    async def start(self):
+        for name, client in self.clients:
+            await client.start()
+            logger.info(f"Worker session {name} started")
+
+    async def stop(self):
+        for name, client in self.clients:
+            try:
+                await client.stop()
+            except Exception as e:
+                logger.error(f"Worker session {name} stop error: {e}")
+
+async def ordered_windows(start_id, end_id, size, fetch, parallel):
+    # Splits the range into windows of `size` IDs, keeps up to `parallel`
+    # fetches in flight and yields (batch_ids, result) strictly in ID order
+    windows = iter(range(start_id, end_id + 1, size))
+    in_flight = deque()
+    try:
+        while True:
+            while len(in_flight) < parallel:
+                batch_start = next(windows, None)
+                if batch_start is None:
+                    break
+                batch_ids = list(range(batch_start, min(batch_start + size, end_id + 1)))
+                in_flight.append((batch_ids, asyncio.create_task(fetch(batch_ids))))
+            if not in_flight:
+                return
+            batch_ids, task = in_flight.popleft()
+            yield batch_ids, await task
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+session_pool = SessionPool()
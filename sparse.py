@@ -0,0 +1,159 @@
+import logging
+from contextlib import aclosing
+from sessions import session_pool, ordered_windows
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+# IDs per probe call, the messages.getMessages limit
+PROBE_SIZE = 200
+# Telegram message IDs are 32-bit
+MAX_MESSAGE_ID = 2 ** 31 - 1
+# Times find_newest restarts past a deleted sample before giving up
+CONFIRM_ROUNDS = 4
+# Largest distance between two sampled IDs: a run of at least GAP_RUN
+# surviving posts inside a gap always contains a sample, so it is never
+# skipped or clamped away. A gap costs one probe per ~GAP_RUN * PROBE_SIZE IDs.
+GAP_RUN = 20
+
+# Bots can't read history, so gaps are found by probing IDs with getMessages.
+# Each probe samples PROBE_SIZE evenly spaced IDs of an interval in one call.
+# Intervals double in length while nothing live turns up (exponential search)
+# until samples are GAP_RUN apart, then the bracket around the first hit is
+# narrowed ~200x per call (binary search). Only a run of fewer than GAP_RUN
+# survivors can fall between samples, which is why probing only starts after
+# a whole window came back empty. Searches without an upper bound pass
+# spacing=None and keep doubling, so they can miss runs of any length.
+
+async def live_ids(client, chat_id, message_ids):
+    messages = await session_pool.fetch(chat_id, message_ids, client)
+    messages = messages if isinstance(messages, list) else [messages]
+    return sorted(m.id for m in messages if m and not m.empty)
+
+def spread(start_id, end_id):
+    # Up to PROBE_SIZE evenly spaced IDs covering [start_id, end_id]
+    if end_id - start_id < PROBE_SIZE:
+        return list(range(start_id, end_id + 1))
+    step = (end_id - start_id) / (PROBE_SIZE - 1)
+    return sorted({start_id + round(i * step) for i in range(PROBE_SIZE)})
+
+def intervals(start_id, end_id, spacing=GAP_RUN):
+    # [start_id, end_id] cut into back-to-back intervals of doubling length,
+    # at most spacing apart once spread over PROBE_SIZE samples
+    longest = spacing * (PROBE_SIZE - 1) + 1 if spacing else None
+    length = PROBE_SIZE
+    while start_id <= end_id:
+        yield start_id, min(start_id + length - 1, end_id)
+        start_id += length
+        length = length * 2 if longest is None else min(length * 2, longest)
+
+async def next_live(client, chat_id, start_id, end_id):
+    # Smallest live ID in [start_id, end_id] found by probing, None if the rest
+    # of the range looks empty
+    try:
+        for low, high in intervals(start_id, end_id):
+            points = spread(low, high)
+            live = await live_ids(client, chat_id, points)
+            if live:
+                break
+        else:
+            return None
+
+        # Narrow the bracket between the last empty sample and the first hit
+        high = live[0]
+        low = max([p for p in points if p < high], default=low - 1) + 1
+        while high - low > 0:
+            complete = high - low <= PROBE_SIZE
+            points = spread(low, high - 1)
+            live = await live_ids(client, chat_id, points)
+            if not live:
+                break
+            high = live[0]
+            if complete:
+                # Every ID below high was checked
+                break
+            low = max([p for p in points if p < high], default=low - 1) + 1
+        return high
+    except Exception as e:
+        # Without a probe result nothing is skipped
+        logger.warning(f"Gap probe failed for {chat_id} from {start_id}: {e}")
+        return start_id
+
+async def find_newest(client, chat_id, start_id, end_id, spacing=GAP_RUN):
+    # Newest live ID in [start_id, end_id], None if probing finds nothing.
+    # Samples only bracket it, and a sampled ID may be a single deleted post
+    # with newer ones after it, so every ID from the last hit to a full window
+    # past the bracket is checked; a live one there restarts the search from it.
+    last = None
+    for _ in range(CONFIRM_ROUNDS):
+        after = None
+        for low, high in intervals(start_id if last is None else last + 1, end_id, spacing):
+            points = spread(low, high)
+            live = await live_ids(client, chat_id, points)
+            if live:
+                last = live[-1]
+                after = min([p for p in points if p > last], default=None)
+            elif last is not None and after is None:
+                after = low
+        if last is None or after is None:
+            # Nothing live, or end_id itself is
+            return last
+
+        # The newest post lies between the last hit and the empty sample after it
+        while after - last > PROBE_SIZE:
+            points = spread(last + 1, after - 1)
+            live = await live_ids(client, chat_id, points)
+            if live:
+                last = live[-1]
+            after = min([p for p in points if p > last], default=after)
+
+        check_end = min(after + PROBE_SIZE - 1, end_id)
+        live = []
+        for low in range(last + 1, check_end + 1, PROBE_SIZE):
+            live += await live_ids(client, chat_id, list(range(low, min(low + PROBE_SIZE - 1, check_end) + 1)))
+        if not live or live[-1] < after:
+            return max(live, default=last)
+        last = live[-1]
+    raise LookupError(f"newest post of {chat_id} not confirmed after {CONFIRM_ROUNDS} rounds")
+
+async def latest_id(client, chat_id, start_id, end_id):
+    # Upper bound for the newest live ID in [start_id, end_id], or end_id when
+    # probing finds nothing to clamp to
+    try:
+        newest = await find_newest(client, chat_id, start_id, end_id)
+        if newest is None:
+            return end_id
+        # Never clamp below a post the catalog has already seen
+        return max(newest, min(await catalog.latest(chat_id), end_id))
+    except Exception as e:
+        logger.warning(f"Latest ID probe failed for {chat_id}: {e}")
+        return end_id
+
+async def newest_id(client, chat_id, start_id, end_id, spacing=GAP_RUN):
+    # Exact newest live ID in [start_id, end_id], start_id - 1 if there is none
+    newest = await find_newest(client, chat_id, start_id, end_id, spacing)
+    return start_id - 1 if newest is None else newest
+
+async def scan_windows(client, chat_id, start_id, end_id, size, fetch, parallel, is_live):
+    # ordered_windows() that probes ahead after a full window without a live
+    # message; a skipped gap is yielded as (range of skipped IDs, None)
+    cursor = start_id
+    while cursor <= end_id:
+        windows = ordered_windows(cursor, end_id, size, fetch, parallel)
+        cursor = end_id + 1
+        async with aclosing(windows):
+            async for batch_ids, result in windows:
+                yield batch_ids, result
+                if len(batch_ids) < size or is_live(result):
+                    continue
+
+                gap_start = batch_ids[-1] + 1
+                next_id = await next_live(client, chat_id, gap_start, end_id)
+                next_id = end_id + 1 if next_id is None else next_id
+                # Resume one window early: a short run of survivors right before
+                # the first hit is the likeliest thing for the samples to miss
+                resume = max(gap_start, next_id - size)
+                if resume - gap_start >= size:
+                    yield range(gap_start, resume), None
+                    cursor = resume
+                    break
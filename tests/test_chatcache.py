@@ -0,0 +1,18 @@
+import asyncio
+from bench.fake_client import FakeChat, FakeClient
+from chatcache import ChatCache, FAILED_TTL
+
+def test_failed_lookups_expire_quickly():
+    client = FakeClient([FakeChat(-1001, 10)])
+    cache = ChatCache()
+
+    async def main():
+        admin = await cache.get(client, -1001)
+        failed = await cache.get(client, -1002)
+        assert admin.usable and not failed.usable
+        for info in (admin, failed):
+            info.fetched -= FAILED_TTL + 1
+        assert cache.lookup(-1001) is admin
+        assert cache.lookup(-1002) is None
+
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import asyncio
+from bench.fake_client import FakeChat, FakeClient
+from dedup import DigestTable, dedup_index, digest
+from uniquify import DeleteBuffer
+
+CHAT = -1001
+
+def test_digest_table_grows():
+    table = DigestTable(size=4)
+    for i in range(1, 1000):
+        table[digest(str(i))] = i
+    table[digest("1")] = 5
+    assert len(table) == 999
+    assert table.get(digest("1")) == 5
+    assert table.get(digest("999")) == 999
+    assert table.get(digest("missing")) is None
+
+def purge(chat, indexed, duplicates):
+    # Indexes (uid, msg_id) pairs, then buffers the duplicates as a scan
+    # would and flushes them; returns the IDs deleted
+    client = FakeClient([chat])
+
+    async def main():
+        dedup_index.chats[CHAT] = DigestTable()
+        for uid, msg_id in indexed:
+            await dedup_index.check(CHAT, uid, msg_id)
+        deleter = DeleteBuffer(client, CHAT, 0, "test")
+        for uid, msg_id in duplicates:
+            original = await dedup_index.check(CHAT, uid, msg_id)
+            holds = lambda m, uid=uid: dedup_index.holds(m, uid)
+            keep = lambda stale, uid=uid, msg_id=msg_id: dedup_index.replace(CHAT, uid, msg_id)
+            await deleter.add(msg_id, uid, original, holds, keep)
+        await deleter.flush()
+
+    try:
+        asyncio.run(main())
+    finally:
+        dedup_index.chats.pop(CHAT, None)
+        dedup_index.pending.pop(CHAT, None)
+    return client.deleted
+
+def test_deleted_original_keeps_its_first_duplicate():
+    # u1 was indexed at message 1, which has since been deleted by hand: of
+    # its copies 2 and 3, 2 becomes the original and only 3 is deleted
+    chat = FakeChat(CHAT, 3)
+    chat.messages = {i: dict(media="photo", file_unique_id="u1") for i in (2, 3)}
+    assert purge(chat, [("u1", 1)], [("u1", 2), ("u1", 3)]) == [3]
+
+def test_edited_original_keeps_the_last_copy():
+    # 260 was indexed as the owner of uX, then its media was replaced: 100 is
+    # now the only copy of uX and must survive
+    chat = FakeChat(CHAT, 300)
+    chat.messages = {100: dict(media="photo", file_unique_id="uX"), 260: dict(media="photo", file_unique_id="uY")}
+    assert purge(chat, [("uX", 260)], [("uX", 100)]) == []
+
+def test_edited_duplicate_is_not_deleted():
+    # The catalog still lists 5 as a copy of u1, but its media was replaced
+    chat = FakeChat(CHAT, 5)
+    chat.messages = {1: dict(media="photo", file_unique_id="u1"), 5: dict(media="photo", file_unique_id="u2")}
+    assert purge(chat, [("u1", 1)], [("u1", 5)]) == []
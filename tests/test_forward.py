@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import forward
+import ratelimit
+from bench.fake_client import FakeChat, FakeClient
+from dedup import dedup_index
+from forward import Forwarder
+from jobs import registry
+
+LIMITS = ("METHOD_RATES", "DEFAULT_METHOD_RATE", "CHAT_RATE", "CHAT_MAX_RATE", "SEND_CHAT_RATE", "SEND_CHAT_MAX_RATE")
+
+def run(coro):
+    # Measure the forwarder, not Telegram's published limits
+    rates = [getattr(ratelimit, name) for name in LIMITS]
+    for name, value in zip(LIMITS, ({}, 1e6, 1e6, 1e6, 1e6, 1e6)):
+        setattr(ratelimit, name, value)
+    ratelimit.scheduler.method_buckets.clear()
+    ratelimit.scheduler.chat_buckets.clear()
+    try:
+        return asyncio.run(coro)
+    finally:
+        for name, value in zip(LIMITS, rates):
+            setattr(ratelimit, name, value)
+        ratelimit.scheduler.method_buckets.clear()
+        ratelimit.scheduler.chat_buckets.clear()
+        dedup_index.chats.clear()
+        dedup_index.pending.clear()
+        dedup_index.indexed.clear()
+
+class Status:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.id = 1
+        self.text = None
+
+    async def edit(self, text, reply_markup=None, **kwargs):
+        self.text = text
+
+def test_unexpected_error_finishes_the_status():
+    client = FakeClient([FakeChat(-1001, 100), FakeChat(-1002, 0)])
+    forwarder = Forwarder(client)
+
+    async def broken_worker(*args):
+        raise RuntimeError("database went away")
+    forwarder.copy_worker = broken_worker
+
+    status = Status()
+    cursor = asyncio.run(forwarder.start_forwarding(-1001, -1002, 1, 100, "ALL", status))
+    assert cursor == 1
+    assert "database went away" in status.text
+    assert not registry.jobs
+
+@pytest.mark.parametrize("mode", ["COPY", "BULK"])
+def test_files_deleted_from_the_destination_are_copied_again(mode):
+    source = FakeChat(-1001, 0)
+    source.messages = {i: dict(media="photo", file_unique_id=f"u{i}") for i in range(1, 31)}
+    source.latest_id = 30
+    target = FakeChat(-1002, 0)
+    client = FakeClient([source, target])
+    forwarder = Forwarder(client, status_interval=1)
+    forward = lambda: forwarder.start_forwarding(-1001, -1002, 1, 30, "ALL", Status(), mode, dedup=True)
+
+    async def main():
+        await forward()
+        assert len(client.copied) == 30
+        # Wiped by hand: the index still lists every file as copied
+        for msg_id in sorted(target.messages)[5:]:
+            del target.messages[msg_id]
+        await forward()
+        assert len(client.copied) == 55
+        await forward()
+        assert len(client.copied) == 55
+
+    run(main())
+    assert sorted(data["file_unique_id"] for data in target.messages.values()) == sorted(f"u{i}" for i in range(1, 31))
+
+class FlakyClient(FakeClient):
+    # Reads touching message 250 time out the first `failures` times
+    def __init__(self, chats, failures):
+        super().__init__(chats)
+        self.failures = failures
+
+    async def get_messages(self, chat_id, message_ids):
+        if self.failures and not isinstance(message_ids, int) and 250 in message_ids:
+            self.failures -= 1
+            raise TimeoutError("request timed out")
+        return await super().get_messages(chat_id, message_ids)
+
+@pytest.mark.parametrize("failures, copied", [(forward.FETCH_ATTEMPTS - 1, 500), (forward.FETCH_ATTEMPTS, 200)])
+def test_failed_window_is_retried_then_stops_the_job(monkeypatch, failures, copied):
+    monkeypatch.setattr(forward, "FETCH_RETRY_DELAY", 0)
+    source = FakeChat(-1001, 0)
+    source.messages = {i: dict(text=f"message {i}") for i in range(1, 501)}
+    source.latest_id = 500
+    client = FlakyClient([source, FakeChat(-1002, 0)], failures)
+    forwarder = Forwarder(client, prefetch_depth=1, status_interval=1)
+    status = Status()
+
+    cursor = run(forwarder.start_forwarding(-1001, -1002, 1, 500, "ALL", status))
+    # A window that can't be read is never counted as done
+    assert sorted(client.copied) == list(range(1, copied + 1))
+    if copied < 500:
+        assert cursor <= 201 and "request timed out" in status.text
+    else:
+        assert cursor == 501 and status.text.startswith("✅")
+
+def test_bulk_mode_forwards_without_the_author():
+    # Albums are copied, so forwarded runs must not carry a header either
+    source = FakeChat(-1001, 300, album_ratio=0.2, seed=3)
+    target = FakeChat(-1002, 0)
+    client = FakeClient([source, target])
+    forwarder = Forwarder(client, status_interval=1)
+
+    run(forwarder.start_forwarding(-1001, -1002, 1, 300, "ALL", Status(), "BULK"))
+    assert sorted(client.copied) == sorted(source.messages)
+    assert client.calls["forward_messages"] and not target.forwarded
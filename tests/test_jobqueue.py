@@ -0,0 +1,111 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+import database
+from database import db
+from jobqueue import JobWorker, job_queue, forward_spec, MAX_ATTEMPTS
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+def run(coro, monkeypatch):
+    # Runs coro against an in-memory MongoDB, leaving the db singleton as it was
+    monkeypatch.setattr(database, "AsyncIOMotorClient", lambda url: mongomock_motor.AsyncMongoMockClient())
+    monkeypatch.setenv("MONGO_URL", "mongodb://test")
+    saved = dict(vars(db))
+
+    async def main():
+        await db.connect()
+        return await coro()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        vars(db).clear()
+        vars(db).update(saved)
+
+class Status:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.id = 1
+        self.empty = False
+
+    async def edit(self, text, **kwargs):
+        pass
+
+    async def reply(self, text, **kwargs):
+        return self
+
+async def enqueue(count=1):
+    return [await job_queue.enqueue(forward_spec(-1001, -1002, 1, 100, "ALL", "COPY"), Status()) for _ in range(count)]
+
+def test_claim_order_and_lease_takeover(monkeypatch):
+    async def main():
+        first, second = await enqueue(2)
+        assert (await db.claim_job("w1", 60))["_id"] == first
+        assert (await db.claim_job("w2", 60))["_id"] == second
+        assert await db.claim_job("w3", 60) is None
+
+        # w1 stops renewing: its job goes to the next worker that polls
+        await db.jobs.update_one({"_id": first}, {"$set": {"lease_expires": time.time() - 1}})
+        doc = await db.claim_job("w3", 60)
+        assert (doc["_id"], doc["owner"], doc["attempts"]) == (first, "w3", 2)
+        assert await db.renew_job_lease(first, "w1", 60) is None
+        assert await db.renew_job_lease(first, "w3", 60) is not None
+
+    run(main, monkeypatch)
+
+def test_cancelled_jobs_are_not_claimed(monkeypatch):
+    async def main():
+        running, queued = await enqueue(2)
+        await db.claim_job("w1", 60)
+        assert await job_queue.cancel(queued) and await job_queue.cancel(running)
+        assert (await db.jobs.find_one({"_id": queued}))["state"] == "cancelled"
+
+        # The worker died before its heartbeat saw the cancel
+        await db.jobs.update_one({"_id": running}, {"$set": {"lease_expires": time.time() - 1}})
+        assert await db.claim_job("w2", 60) is None
+        assert (await db.jobs.find_one({"_id": running}))["state"] == "cancelled"
+
+    run(main, monkeypatch)
+
+def test_unfinished_job_is_retried_then_failed(monkeypatch):
+    # A refused or failed forward returns its cursor instead of end_id + 1
+    forwarder = SimpleNamespace(start_forwarding=lambda *args, **kwargs: asyncio.sleep(0, 1))
+    client = SimpleNamespace(get_messages=lambda chat_id, msg_id: asyncio.sleep(0, Status()))
+    worker = JobWorker(client, forwarder, None, "w1")
+
+    async def execute():
+        doc = await db.claim_job("w1", 60)
+        await worker.slots.acquire()
+        await worker.execute(doc)
+        return await db.jobs.find_one({"_id": doc["_id"]})
+
+    async def main():
+        job_id, = await enqueue()
+        doc = await execute()
+        assert doc["state"] == "queued" and doc["retry_at"] > time.time()
+        assert await db.claim_job("w1", 60) is None
+
+        await db.jobs.update_one({"_id": job_id}, {"$set": {"retry_at": 0, "attempts": MAX_ATTEMPTS - 1}})
+        doc = await execute()
+        assert doc["state"] == "failed"
+
+        # /resume job_id queues it again
+        assert await job_queue.retry(job_id)
+        assert (await db.claim_job("w2", 60))["_id"] == job_id
+
+    run(main, monkeypatch)
+
+def test_completed_job_is_done(monkeypatch):
+    forwarder = SimpleNamespace(start_forwarding=lambda *args, **kwargs: asyncio.sleep(0, 101))
+    client = SimpleNamespace(get_messages=lambda chat_id, msg_id: asyncio.sleep(0, Status()))
+    worker = JobWorker(client, forwarder, None, "w1")
+
+    async def main():
+        job_id, = await enqueue()
+        await worker.slots.acquire()
+        await worker.execute(await db.claim_job("w1", 60))
+        assert (await db.jobs.find_one({"_id": job_id}))["state"] == "done"
+
+    run(main, monkeypatch)
@@ -0,0 +1,10 @@
+import metrics
+
+def test_clear_job_removes_its_label_sets():
+    metrics.count("job-a", "forward", "copied", 3)
+    metrics.count("job-a", "forward", "fetched")
+    metrics.count("job-b", "forward", "copied")
+    metrics.clear_job("job-a")
+    jobs = {s.labels["job"] for m in metrics.MESSAGES.collect() for s in m.samples}
+    assert "job-a" not in jobs and "job-b" in jobs
+    metrics.clear_job("job-b")
@@ -0,0 +1,76 @@
+import asyncio
+import ratelimit
+import mirror as mirror_module
+from bench.fake_client import FakeChat, FakeClient
+from forward import Forwarder
+from jobs import registry
+from mirror import Mirror, MirrorLink
+
+SOURCE, TARGET = -1001, -1002
+LIMITS = ("METHOD_RATES", "DEFAULT_METHOD_RATE", "CHAT_RATE", "CHAT_MAX_RATE", "SEND_CHAT_RATE", "SEND_CHAT_MAX_RATE")
+
+def run(coro):
+    # Measure the mirror, not Telegram's published limits
+    rates = [getattr(ratelimit, name) for name in LIMITS]
+    for name, value in zip(LIMITS, ({}, 1e6, 1e6, 1e6, 1e6, 1e6)):
+        setattr(ratelimit, name, value)
+    ratelimit.scheduler.method_buckets.clear()
+    ratelimit.scheduler.chat_buckets.clear()
+    try:
+        return asyncio.run(coro)
+    finally:
+        for name, value in zip(LIMITS, rates):
+            setattr(ratelimit, name, value)
+        ratelimit.scheduler.method_buckets.clear()
+        ratelimit.scheduler.chat_buckets.clear()
+
+def test_refused_backfill_leaves_a_gap_retried_in_the_background(monkeypatch):
+    source = FakeChat(SOURCE, 800)
+    client = FakeClient([source, FakeChat(TARGET, 0)])
+    mirror = Mirror(client, Forwarder(client, status_interval=1), flush_delay=0)
+    link = MirrorLink({"from_chat": SOURCE, "to_chat": TARGET, "filter": "ALL", "mode": "COPY", "last_id": 500, "status_chat": 1})
+
+    async def main():
+        # e.g. a resumed checkpoint of the same chat pair still running
+        busy = registry.register("forward", (str(SOURCE), str(TARGET)), {})
+        # Keep the retrier waiting until the live post below is mirrored
+        monkeypatch.setattr(mirror_module, "GAP_RETRY_INTERVAL", 3600)
+        await mirror.backfill(link)
+        assert link.gaps == [[501, 800]]
+        assert link.last_id == 800
+
+        source.messages[801] = dict(text="live")
+        link.buffer[801] = client.build(source, 801)
+        await mirror.flush(link)
+        assert link.last_id == 801
+
+        registry.remove(busy.id)
+        link.retrier.cancel()
+        monkeypatch.setattr(mirror_module, "GAP_RETRY_INTERVAL", 0)
+        await mirror.retry_gaps(link)
+        assert link.gaps == []
+
+    run(main())
+    assert sorted(client.copied) == sorted(i for i in source.messages if i > 500)
+    assert len(client.copied) == len(set(client.copied))
+
+def test_failed_probe_leaves_an_open_gap_bounded_by_the_first_live_post(monkeypatch):
+    async def broken(*args, **kwargs):
+        raise LookupError("probe failed")
+    monkeypatch.setattr(mirror_module, "newest_id", broken)
+    monkeypatch.setattr(mirror_module, "GAP_RETRY_INTERVAL", 3600)
+    source = FakeChat(SOURCE, 800)
+    client = FakeClient([source, FakeChat(TARGET, 0)])
+    mirror = Mirror(client, Forwarder(client, status_interval=1), flush_delay=0)
+    link = MirrorLink({"from_chat": SOURCE, "to_chat": TARGET, "filter": "ALL", "mode": "COPY", "last_id": 500, "status_chat": 1})
+
+    async def main():
+        await mirror.backfill(link)
+        assert link.gaps == [[501, None]] and link.last_id == 500
+        source.messages[801] = dict(text="live")
+        link.buffer[801] = client.build(source, 801)
+        await mirror.flush(link)
+        link.retrier.cancel()
+        assert link.gaps == [[501, 800]] and link.last_id == 801
+
+    run(main())
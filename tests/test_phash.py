@@ -0,0 +1,65 @@
+import asyncio
+from dedup import DigestTable, dedup_index
+from phash import HammingIndex, Preview, near_index
+
+CHAT = -1001
+
+def run(coro):
+    near_index.chats[CHAT] = {}
+    near_index.kept[CHAT] = {}
+    dedup_index.chats[CHAT] = DigestTable()
+    try:
+        return asyncio.run(coro)
+    finally:
+        near_index.chats.pop(CHAT, None)
+        near_index.kept.pop(CHAT, None)
+        dedup_index.chats.pop(CHAT, None)
+        dedup_index.pending.pop(CHAT, None)
+
+def test_search_within_radius():
+    index = HammingIndex()
+    index.add(0, 1)
+    assert index.search(0b11111, 5) == 1
+    assert index.search(0b111111, 5) is None
+    assert index.search(0, 5, below=1) is None
+
+def test_remove():
+    index = HammingIndex()
+    index.add(0b101, 1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.search(0b101, 8) is None
+
+def test_rescan_with_larger_threshold_keeps_one_of_a_pair():
+    # 100 and 500 are 5 bits apart: both survive /near 4, and /near 8 must
+    # then delete only the later one
+    a, b = 0, 0b11111 << 20
+
+    async def scan(threshold):
+        return [await near_index.check(CHAT, uid, msg_id, Preview("photo", value, None, None), threshold) for uid, msg_id, value in (("a", 100, a), ("b", 500, b))]
+
+    async def main():
+        assert await scan(4) == [None, None]
+        assert await scan(8) == [None, 100]
+        assert await scan(8) == [None, 100]
+        assert list(near_index.chats[CHAT]["photo"].items) == [100]
+
+    run(main())
+
+def test_shared_covers_need_matching_size_and_duration():
+    # All thumbnails are identical: a preview photo, then episodes of a series
+    # and a document with the same cover
+    media = [
+        ("photo", 1, Preview("photo", 7, 50_000, None)),
+        ("ep1", 2, Preview("video", 7, 300_000_000, 1440)),
+        ("ep2", 3, Preview("video", 7, 290_000_000, 1436)),
+        ("ep1_reupload", 4, Preview("video", 7, 301_000_000, 1440)),
+        ("pdf", 5, Preview("document", 7, 2_000_000, None)),
+        ("notes", 6, Preview("document", 7, 900_000, None)),
+    ]
+
+    async def main():
+        return [await near_index.check(CHAT, uid, msg_id, value, 4) for uid, msg_id, value in media]
+
+    assert run(main()) == [None, None, None, 2, None, None]
+
@@ -0,0 +1,26 @@
+import ratelimit
+from ratelimit import FLOOD_HEADROOM, RateScheduler, TokenBucket
+
+def test_recovery_stays_below_the_flood_rate():
+    bucket = TokenBucket(10, 30)
+    bucket.on_flood()
+    assert bucket.rate == 5
+    for _ in range(10000):
+        bucket.on_success()
+    assert bucket.rate == 10 * FLOOD_HEADROOM
+
+def test_flood_memory_expires():
+    bucket = TokenBucket(10, 30)
+    bucket.on_flood()
+    bucket.flooded -= ratelimit.FLOOD_MEMORY + 1
+    for _ in range(10000):
+        bucket.on_success()
+    assert bucket.rate == 30
+
+def test_sends_use_their_own_chat_bucket():
+    scheduler = RateScheduler()
+    send = scheduler.chat_bucket(-1001, method="copy_message")
+    read = scheduler.chat_bucket(-1001, method="get_messages")
+    assert send is not read
+    assert send.rate == ratelimit.SEND_CHAT_RATE
+    assert send is scheduler.chat_bucket(-1001, method="forward_messages")
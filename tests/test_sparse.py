@@ -0,0 +1,71 @@
+import asyncio
+from contextlib import aclosing
+import ratelimit
+from bench.fake_client import FakeChat, FakeClient
+from sparse import latest_id, newest_id, live_ids, scan_windows, GAP_RUN
+
+LIMITS = ("METHOD_RATES", "DEFAULT_METHOD_RATE", "CHAT_RATE", "CHAT_MAX_RATE")
+
+def run(coro):
+    # Measure probing, not Telegram's published limits
+    rates = [getattr(ratelimit, name) for name in LIMITS]
+    for name, value in zip(LIMITS, ({}, 1e6, 1e6, 1e6)):
+        setattr(ratelimit, name, value)
+    ratelimit.scheduler.method_buckets.clear()
+    ratelimit.scheduler.chat_buckets.clear()
+    try:
+        return asyncio.run(coro)
+    finally:
+        for name, value in zip(LIMITS, rates):
+            setattr(ratelimit, name, value)
+        ratelimit.scheduler.method_buckets.clear()
+        ratelimit.scheduler.chat_buckets.clear()
+
+def island_chat(size, island):
+    # Posts 1-1000 and a run of island posts at 60000, everything else deleted
+    chat = FakeChat(-1001, size)
+    keep = set(range(1, 1001)) | set(range(60000, 60000 + island))
+    chat.messages = {i: m for i, m in chat.messages.items() if i in keep or i > 150000}
+    return chat
+
+async def read_ids(client, end_id):
+    read = []
+    fetch = lambda ids: live_ids(client, -1001, ids)
+    async with aclosing(scan_windows(client, -1001, 1, end_id, 200, fetch, 1, bool)) as windows:
+        async for batch_ids, live in windows:
+            read += live or []
+    return read
+
+def test_latest_id_clamps_past_the_newest_post():
+    client = FakeClient([FakeChat(-1001, 50000)])
+    bound = run(latest_id(client, -1001, 1, 60000))
+    assert 50000 <= bound < 60000
+
+def test_latest_id_not_fooled_by_a_deleted_sample():
+    # 49971 is deleted and lands on a sample point; the 29 posts after it
+    # must not be clamped away
+    client = FakeClient([FakeChat(-1001, 50000, gaps=((49971, 49971),))])
+    assert run(latest_id(client, -1001, 1, 60000)) >= 50000
+    assert run(newest_id(client, -1001, 1, 60000)) == 50000
+
+def test_newest_id_of_an_empty_range():
+    client = FakeClient([FakeChat(-1001, 100)])
+    assert run(newest_id(client, -1001, 200, 5000)) == 199
+
+def test_newest_id_with_scattered_deletions():
+    for seed in range(5):
+        chat = FakeChat(-1001, 30000, deleted_ratio=0.3, gaps=((10000, 25000),), seed=seed)
+        client = FakeClient([chat])
+        assert run(newest_id(client, -1001, 1, 100000)) == max(chat.messages)
+
+def test_island_inside_a_large_gap_is_not_clamped_or_skipped():
+    for size, end_id in ((60100, 100000), (200000, 200000)):
+        chat = island_chat(size, 101)
+        client = FakeClient([chat])
+        assert run(latest_id(client, -1001, 1, end_id)) >= max(chat.messages)
+        assert run(read_ids(client, end_id)) == sorted(chat.messages)
+
+def test_shortest_guaranteed_island():
+    chat = island_chat(60100, GAP_RUN)
+    client = FakeClient([chat])
+    assert run(read_ids(client, 100000)) == sorted(chat.messages)
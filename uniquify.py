@@ -1,19 +1,117 @@
 import asyncio
+import time
 import logging
-from pyrogram import enums, filters
-from pyrogram.errors import FloodWait
+import uuid
+from contextlib import aclosing
+from pyrogram import filters
+from pyrogram.errors import ChatAdminRequired
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from forward import get_font
+from forward import get_font, FETCH_BATCH_SIZE
+from ratelimit import scheduler
+from jobs import Checkpointer
+from dedup import dedup_index, media_unique_id, FILE_TYPES
+from phash import near_index, NEAR_TYPES, MAX_NEAR_THRESHOLD
+from progress import ProgressReporter, RateWindow, STATUS_INTERVAL
+from chatcache import chat_cache
+from catalog import catalog
+from sessions import session_pool
+from sparse import scan_windows, latest_id
+import metrics
 
 logger = logging.getLogger(__name__)
 
+# messages.deleteMessages / channels.deleteMessages accept up to 100 IDs
+DELETE_BATCH_SIZE = 100
+# Buffered duplicates are deleted at least this often (seconds)
+DELETE_FLUSH_INTERVAL = 10
+
+class DeleteBuffer:
+    def __init__(self, client, chat_id, delay, job_id):
+        self.client = client
+        self.chat_id = chat_id
+        self.job_id = job_id
+        self.delay = delay
+        self.pending = [] # (msg_id, file_unique_id, original, holds, keep)
+        self.deleted = 0
+        self.last_flush = time.time()
+
+    async def add(self, msg_id, file_unique_id, original, holds, keep):
+        # holds(message) tells whether the original still carries the file;
+        # keep(original) makes msg_id the kept copy if it no longer does
+        self.pending.append((msg_id, file_unique_id, original, holds, keep))
+        metrics.set_queue_depth(self.job_id, "delete", len(self.pending))
+        if len(self.pending) >= DELETE_BATCH_SIZE:
+            return await self.flush()
+        return False
+
+    async def tick(self):
+        if self.pending and time.time() - self.last_flush >= DELETE_FLUSH_INTERVAL:
+            return await self.flush()
+        return False
+
+    async def confirm(self, pending):
+        # The index and the catalog may be stale: an original deleted or edited
+        # since, e.g. by hand, or a duplicate whose media was replaced. Both
+        # sides are re-read in one call (at most 100 + 100 IDs) and a message
+        # is only deleted while both still carry the file. The first duplicate
+        # of an original that lost it is kept in its place instead, so the
+        # last copy of a file is never purged.
+        ids = sorted({i for msg_id, _, original, _, _ in pending for i in (msg_id, original)})
+        messages = await scheduler.call("get_messages", self.chat_id, self.client.get_messages, self.chat_id, ids)
+        messages = [m for m in (messages if isinstance(messages, list) else [messages]) if m]
+        await catalog.record(self.chat_id, messages)
+        current = {m.id: m for m in messages if not m.empty}
+        batch = []
+        replaced = {} # stale original: file_unique_id of the copy kept instead
+        for msg_id, uid, original, holds, keep in pending:
+            msg = current.get(msg_id)
+            if msg is None or media_unique_id(msg) != uid:
+                metrics.count(self.job_id, "uniquify", "changed")
+                continue
+            if original in replaced:
+                # Only exact copies of the replacement are safe to delete
+                if replaced[original] == uid:
+                    batch.append(msg_id)
+                    continue
+            elif original in current and await holds(current[original]):
+                batch.append(msg_id)
+                continue
+            replaced.setdefault(original, uid)
+            await keep(original)
+            metrics.count(self.job_id, "uniquify", "stale_original")
+        return batch
+
+    async def flush(self):
+        if not self.pending:
+            return False
+        pending, self.pending = self.pending, []
+        metrics.set_queue_depth(self.job_id, "delete", 0)
+        try:
+            batch = await self.confirm(pending)
+            if batch:
+                await scheduler.call("delete_messages", self.chat_id, self.client.delete_messages, self.chat_id, batch)
+                self.deleted += len(batch)
+                metrics.count(self.job_id, "uniquify", "deleted", len(batch))
+                await catalog.mark_empty(self.chat_id, batch)
+        except ChatAdminRequired:
+            chat_cache.invalidate(self.chat_id)
+            logger.error(f"Delete permission lost in {self.chat_id}")
+        except Exception as e:
+            logger.error(f"Delete error in {self.chat_id} for {len(pending)} messages: {e}")
+        self.last_flush = time.time()
+        # The user delay paces delete calls, not individual messages
+        await asyncio.sleep(self.delay)
+        return True
+
 class Uniquifier:
-    def __init__(self, client):
+    def __init__(self, client, status_interval=STATUS_INTERVAL):
         self.client = client
-        self.purge_status = {}
+        self.status_interval = status_interval
+        self.purge_status = {} # user_id: job_id
         self.chat_configs = {} # user_id: chat_id
         self.delays = {} # user_id: delay_seconds
-        self.FILE_TYPES = ["photo", "animation", "document", "video", "audio"]
+        self.near = {} # user_id: Hamming distance for near-duplicates, 0 = exact only
+        self.FILE_TYPES = FILE_TYPES
 
     async def set_chat(self, user_id, chat_id_str, message):
         try:
@@ -22,11 +120,13 @@ class Uniquifier:
             else:
                 return await message.reply(f"❌ {get_font('Invalid Chat ID format')}")
 
-            member = await self.client.get_chat_member(chat_id, "me")
-            if member.status not in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]:
+            info = await chat_cache.get(self.client, chat_id)
+            if info.error is not None:
+                raise info.error
+            if not info.is_admin:
                 return await message.reply(f"❌ {get_font('Bot must be admin with delete permissions')}")
             
-            if not member.privileges.can_delete_messages:
+            if not info.privileges.can_delete_messages:
                 return await message.reply(f"❌ {get_font('Bot does not have delete messages permission')}")
 
             self.chat_configs[user_id] = chat_id
@@ -43,73 +143,189 @@ class Uniquifier:
         self.delays[user_id] = delay
         await message.reply(f"✅ {get_font('Delay set to')} {delay} {get_font('seconds')}")
 
-    async def start_purge(self, user_id, start_id, end_id, message):
+    async def set_near(self, user_id, threshold_str, message):
+        if not threshold_str.isdigit() or int(threshold_str) > MAX_NEAR_THRESHOLD:
+            return await message.reply(f"❌ {get_font('Threshold must be a number from 0 to')} {MAX_NEAR_THRESHOLD}")
+
+        threshold = int(threshold_str)
+        self.near[user_id] = threshold
+        if threshold:
+            await message.reply(f"✅ {get_font('Near-duplicates within')} {threshold} {get_font('bits will be removed')}")
+        else:
+            await message.reply(f"✅ {get_font('Only exact duplicates will be removed')}")
+
+    async def start_purge(self, user_id, start_id, end_id, message, checkpoint=None):
+        # Returns True once the whole range was scanned, False if the purge is
+        # refused, cancelled or fails
+        if checkpoint:
+            self.chat_configs[user_id] = checkpoint["chat_id"]
+            self.delays[user_id] = checkpoint["delay"]
+            self.near[user_id] = checkpoint.get("near", 0)
+
+        if user_id in self.purge_status:
+            await message.reply(f"❌ {get_font('A purge is already running')}")
+            return False
+
         if user_id not in self.chat_configs:
-            return await message.reply(f"❌ {get_font('Configure the target chat first using')} `/chat chat_id`")
+            await message.reply(f"❌ {get_font('Configure the target chat first using')} `/chat chat_id`")
+            return False
 
         chat_id = self.chat_configs[user_id]
         delay = self.delays.get(user_id, 0)
-        self.purge_status[user_id] = True
+        near = self.near.get(user_id, 0)
+        job_id = checkpoint["job_id"] if checkpoint else uuid.uuid4().hex[:8]
+        self.purge_status[user_id] = job_id
+        checkpointer = Checkpointer(job_id)
         
         msg1 = await message.reply(f"⏳ {get_font('Processing... This will take some time')}")
         
         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(get_font("Cancel"), callback_data="uni_CANCEL")]])
         msg2 = await message.reply(f"🔍 {get_font('Looking for Duplicates')}...", reply_markup=keyboard)
 
-        id_index = []
-        duplicates = 0
-        total_scanned = 0
+        duplicates = checkpoint["duplicates"] if checkpoint else 0
+        total_scanned = checkpoint["scanned"] if checkpoint else 0
+        cursor = checkpoint["cursor"] if checkpoint else start_id
+        # IDs past the channel's newest post would only come back empty
+        end_id = max(await latest_id(self.client, chat_id, start_id, end_id), cursor - 1)
+        deleter = DeleteBuffer(self.client, chat_id, delay, job_id)
+        deleter.deleted = duplicates
+
+        msg_id = cursor
+        window = RateWindow()
+
+        def render_deleted():
+            return f"**{get_font('Messages deleted')}**: {deleter.deleted}\n**{get_font('Current ID')}**: {msg_id}", None
+
+        def render_scan():
+            window.add(msg_id - start_id)
+            eta_sec = window.eta(end_id - msg_id)
+            eta = time.strftime("%Hh %Mm %Ss", time.gmtime(eta_sec)) if eta_sec is not None else "Calculating..."
+            text = (
+                f"🔍 {get_font('Scanning ID')}: {msg_id}\n"
+                f"📊 {get_font('Scanned')}: {total_scanned}\n"
+                f"🗑️ {get_font('Duplicates Found')}: {duplicates}\n"
+                f"⚡ {get_font('Speed')}: {window.rate():.1f} {get_font('msg/s')}\n"
+                f"⏳ {get_font('ETA')}: {eta}"
+            )
+            return text, keyboard
+
+        deleted_reporter = ProgressReporter(msg1, render_deleted, self.status_interval)
+        scan_reporter = ProgressReporter(msg2, render_scan, self.status_interval)
+
+        def checkpoint_data(msg_id):
+            return {
+                "kind": "uniquify",
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "delay": delay,
+                "near": near,
+                "start_id": start_id,
+                "end_id": end_id,
+                "cursor": msg_id,
+                "scanned": total_scanned,
+                "duplicates": duplicates,
+                "status_chat": message.chat.id,
+            }
 
         try:
-            # Use ID-range scanning instead of get_chat_history for bot compatibility
-            for msg_id in range(start_id, end_id + 1):
-                if user_id not in self.purge_status:
-                    await msg1.delete()
-                    await msg2.edit(f"🛑 {get_font('Purging Cancelled by user')}")
-                    return
-
-                try:
-                    msg = await self.client.get_messages(chat_id, msg_id)
-                    total_scanned += 1
-                    
-                    if msg and not msg.empty:
-                        for file_type in self.FILE_TYPES:
-                            media = getattr(msg, file_type, None)
-                            if media is not None:
-                                uid = str(media.file_unique_id)
-                                if uid in id_index:
-                                    try:
-                                        await msg.delete()
-                                        duplicates += 1
-                                        if duplicates % 5 == 0:
-                                            await msg1.edit(f"**{get_font('Messages deleted')}**: {duplicates}\n**{get_font('Current ID')}**: {msg.id}")
-                                    except FloodWait as e:
-                                        await asyncio.sleep(e.value)
-                                    except Exception:
-                                        pass
-                                    await asyncio.sleep(delay)
+            # Use ID-range scanning instead of get_chat_history for bot compatibility.
+            # file_unique_id is the same for every bot, so worker sessions can
+            # scan windows in parallel. Gaps of deleted IDs are probed over.
+            parallel = max(1, len(session_pool))
+            fetch = lambda ids: catalog.scan(self.client, chat_id, ids, job_id, "uniquify")
+            is_live = lambda entries: any(not entry["empty"] for entry in entries.values())
+            windows = scan_windows(self.client, chat_id, cursor, end_id, FETCH_BATCH_SIZE, fetch, parallel, is_live)
+            async with aclosing(windows):
+                async for batch_ids, entries in windows:
+                    if entries is None:
+                        msg_id = batch_ids[-1]
+                        metrics.count(job_id, "uniquify", "gap_skipped", len(batch_ids))
+                        continue
+
+                    hashes = {}
+                    if near:
+                        # Thumbnails for the whole window are hashed up front,
+                        # in worker processes
+                        media = [e for e in entries.values() if not e["empty"] and e.get("kind") in NEAR_TYPES]
+                        try:
+                            hashes = await near_index.hashes(self.client, chat_id, media)
+                        except ChatAdminRequired:
+                            raise
+                        except Exception as e:
+                            logger.error(f"Hashing error in {chat_id} {batch_ids[0]}-{batch_ids[-1]}: {e}")
+
+                    for msg_id in batch_ids:
+                        if await deleter.tick():
+                            deleted_reporter.touch()
+
+                        if checkpointer.is_due(msg_id - start_id):
+                            # Buffered deletes and the dedup index must be durable
+                            # before the cursor moves past them
+                            if await deleter.flush():
+                                deleted_reporter.touch()
+                            await dedup_index.flush(chat_id)
+                            await checkpointer.save(checkpoint_data(msg_id), msg_id - start_id)
+
+                        if self.purge_status.get(user_id) != job_id:
+                            await deleter.flush()
+                            await dedup_index.flush(chat_id)
+                            await checkpointer.clear()
+                            deleted_reporter.close()
+                            await msg1.delete()
+                            await scan_reporter.finish(f"🛑 {get_font('Purging Cancelled by user')}")
+                            return False
+
+                        entry = entries.get(msg_id)
+                        if entry is None:
+                            continue
+
+                        try:
+                            total_scanned += 1
+                            if not entry["empty"] and entry.get("kind") in self.FILE_TYPES:
+                                uid = entry["file_unique_id"]
+                                if near:
+                                    value = hashes.get(uid)
+                                    original = await near_index.check(chat_id, uid, msg_id, value, near)
+                                    holds = lambda m, uid=uid, value=value: near_index.holds(self.client, chat_id, m, uid, value, near)
+                                    keep = lambda stale, uid=uid, msg_id=msg_id, value=value: near_index.replace(chat_id, uid, msg_id, value, stale)
                                 else:
-                                    id_index.append(uid)
-                    
-                    if total_scanned % 50 == 0:
-                        await msg2.edit(f"🔍 {get_font('Scanning ID')}: {msg_id}\n📊 {get_font('Scanned')}: {total_scanned}\n🗑️ {get_font('Duplicates Found')}: {duplicates}", reply_markup=keyboard)
-
-                except FloodWait as e:
-                    await asyncio.sleep(e.value)
-                except Exception:
-                    continue
+                                    original = await dedup_index.check(chat_id, uid, msg_id)
+                                    holds = lambda m, uid=uid: dedup_index.holds(m, uid)
+                                    keep = lambda stale, uid=uid, msg_id=msg_id: dedup_index.replace(chat_id, uid, msg_id)
+                                if original is not None:
+                                    duplicates += 1
+                                    if await deleter.add(msg_id, uid, original, holds, keep):
+                                        deleted_reporter.touch()
+
+                            scan_reporter.touch()
+
+                        except Exception:
+                            continue
 
+            await deleter.flush()
+            await dedup_index.flush(chat_id)
+            await checkpointer.clear()
             if duplicates == 0:
+                deleted_reporter.close()
                 await msg1.delete()
-                await msg2.edit(f"✅ {get_font('No duplicates found in the range')} {start_id}-{end_id}")
+                await scan_reporter.finish(f"✅ {get_font('No duplicates found in the range')} {start_id}-{end_id}")
             else:
-                await msg2.edit(f"✅ {get_font('Success! All duplicate media were deleted')}\n**{get_font('Total Scanned')}**: {total_scanned}\n**{get_font('Total Deleted')}**: {duplicates}")
+                deleted_reporter.close()
+                await deleted_reporter.flush()
+                await scan_reporter.finish(f"✅ {get_font('Success! All duplicate media were deleted')}\n**{get_font('Total Scanned')}**: {total_scanned}\n**{get_font('Total Deleted')}**: {deleter.deleted}")
+            return True
         
         except Exception as e:
             logger.error(f"Purge error: {e}")
-            await msg2.edit(f"❌ {get_font('Error')}: {str(e)}")
+            await scan_reporter.finish(f"❌ {get_font('Error')}: {str(e)}")
+            return False
         finally:
-            self.purge_status.pop(user_id, None)
+            deleted_reporter.close()
+            scan_reporter.close()
+            metrics.clear_queue_depth(job_id, "delete")
+            metrics.clear_job(job_id)
+            if self.purge_status.get(user_id) == job_id:
+                self.purge_status.pop(user_id, None)
 
     def cancel(self, user_id):
         self.purge_status.pop(user_id, None)
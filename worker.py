@@ -0,0 +1,48 @@
+import os
+import socket
+import asyncio
+import logging
+from pyrogram import Client
+from database import db
+from forward import Forwarder
+from uniquify import Uniquifier
+from jobqueue import JobWorker
+from health import Watchdog
+from dotenv import load_dotenv
+
+# Job worker process: claims queued forward/uniquify jobs from MongoDB and runs
+# them. Start any number of these next to bot.py with JOB_QUEUE=true.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv("config.env")
+
+API_ID = int(os.environ.get("API_ID", 0))
+API_HASH = os.environ.get("API_HASH", "")
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", 4))
+STATUS_INTERVAL = int(os.environ.get("STATUS_INTERVAL", 5))
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 2))
+
+# Same bot account as bot.py, so status messages can be edited, but its own
+# session and no updates: commands and buttons stay with the bot process
+app = Client(f"job_worker_{WORKER_ID}", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN, no_updates=True)
+forwarder = Forwarder(app, prefetch_depth=PREFETCH_DEPTH, status_interval=STATUS_INTERVAL)
+uniquifier = Uniquifier(app, status_interval=STATUS_INTERVAL)
+
+async def main():
+    if not await db.connect():
+        logger.error("MONGO_URL not set, the job queue needs a database.")
+        return
+    await app.start()
+    asyncio.create_task(Watchdog().run())
+    logger.info(f"Job worker {WORKER_ID} started with {WORKER_CONCURRENCY} slot(s)")
+    try:
+        await JobWorker(app, forwarder, uniquifier, WORKER_ID, WORKER_CONCURRENCY).run()
+    finally:
+        await app.stop()
+
+if __name__ == "__main__":
+    app.run(main())